@@ -0,0 +1,159 @@
+# Compares the sync and gevent worker modes against a slow upstream. Needs uwsgi and gevent:
+#     python benchmark_worker_modes.py [--processes 4] [--concurrency 200] [--requests 1000] [--upstream-delay 0.5]
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import gevent
+import requests
+from gevent.pool import Pool
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PORT = 3198
+UPSTREAM_PORT = 3199
+
+
+def run_fake_upstream(port:int, delay:float) -> None:
+    from gevent.pywsgi import WSGIServer
+
+    def application(environ, start_response):
+        gevent.sleep(delay)
+        start_response('201 CREATED', [('Content-Type', 'application/json')])
+        return [b'{}']
+
+    WSGIServer(('127.0.0.1', port), application, log=None).serve_forever()
+
+
+def prepare_database(database_uri:str) -> str:
+    '''Create the schema and one credit record, and return an admin access token'''
+    os.environ['TEST_DATABASE_URI'] = database_uri
+    sys.path.insert(0, APP_DIR)
+    from flask_jwt_extended import create_access_token
+    from factory import create_app
+    from models import db
+    from models.credit import CreditModel
+    from models.salesman import SalesmanModel
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        SalesmanModel(user_id=1, limit=1000).insert_record()
+        CreditModel(salesman_id=1, license_id=1).insert_record()
+        return create_access_token(identity={'id': 1, 'privileges': 'Admin'})
+
+
+def start_app(mode:str, processes:int, concurrency:int, env:dict) -> subprocess.Popen:
+    command = [
+        'uwsgi', '--http', f'127.0.0.1:{APP_PORT}', '--master', '--processes', str(processes),
+        '--chdir', APP_DIR, '--callable', 'app', '--disable-logging', '--die-on-term',
+    ]
+    if mode == 'gevent':
+        command += ['--module', 'gevent_main', '--gevent', str(concurrency), '--gevent-early-monkey-patch']
+    else:
+        command += ['--module', 'main']
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            # uwsgi answers 500 when the app failed to import, so wait for a real 200
+            if requests.get(f'http://127.0.0.1:{APP_PORT}/api/swagger.json', timeout=1).status_code == 200:
+                return server
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'The app did not start in {mode} mode')
+
+
+def run_load(token:str, concurrency:int, total:int) -> dict:
+    url = f'http://127.0.0.1:{APP_PORT}/api/credit/1'
+    headers = {'Authorization': f'Bearer {token}'}
+    latencies = []
+    statuses = {}
+
+    def call(_):
+        started = time.perf_counter()
+        try:
+            status = requests.get(url, headers=headers, timeout=120).status_code
+        except requests.RequestException:
+            status = 'error'
+        latencies.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    Pool(concurrency).map(call, range(total))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+    return {
+        'ok': statuses.get(200, 0),
+        'statuses': statuses,
+        'elapsed': elapsed,
+        'throughput': total / elapsed,
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the sync and gevent worker modes against a slow upstream')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--upstream-delay', type=float, default=0.5)
+    parser.add_argument('--fake-upstream', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fake_upstream:
+        run_fake_upstream(UPSTREAM_PORT, args.upstream_delay)
+        return
+
+    upstream = subprocess.Popen([sys.executable, __file__, '--fake-upstream', '--upstream-delay', str(args.upstream_delay)])
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+        token = prepare_database(database_uri)
+
+        env = dict(os.environ)
+        env.update({
+            'APP_CONFIG': 'testing',
+            'TEST_DATABASE_URI': database_uri,
+            'USER_SERVICE_URL': f'http://127.0.0.1:{UPSTREAM_PORT}',
+            # Measure the worker model, not load shedding
+            'ADMISSION_DEFAULT_LIMIT': '10000',
+            'ADMISSION_CREDIT_READ_LIMIT': '10000',
+            'ADMISSION_LOG_SERVICE_LIMIT': '10000',
+            'ADMISSION_TOKEN_LIMIT': '10000',
+        })
+
+        results = {}
+        try:
+            for mode in ('sync', 'gevent'):
+                server = start_app(mode, args.processes, args.concurrency, env)
+                try:
+                    results[mode] = run_load(token, args.concurrency, args.requests)
+                finally:
+                    server.terminate()
+                    server.wait()
+        finally:
+            upstream.terminate()
+            upstream.wait()
+
+    print(f'{args.requests} requests, {args.concurrency} concurrent, {args.processes} processes, '
+          f'upstream delay {args.upstream_delay:.2f}s')
+    print(f"{'mode':<8} {'ok':>6} {'elapsed':>9} {'req/s':>8} {'p50':>7} {'p95':>7} {'p99':>7}  statuses")
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['ok']:>6} {result['elapsed']:>8.2f}s {result['throughput']:>8.1f} "
+              f"{result['p50']:>6.2f}s {result['p95']:>6.2f}s {result['p99']:>6.2f}s  {result['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config(object):
     SQLALCHEMY_ECHO = False
@@ -8,28 +9,103 @@ class Config(object):
     DEBUG = False
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI')
     SQLALCHEMY_TRACK_MODIFICATIONS = bool(os.getenv('SQLALCHEMY_TRACK_MODIFICATIONS'))
-    SQLALCHEMY_ENGINE_OPTIONS = {'pool_recycle': 280, 'pool_timeout': 100, 'pool_pre_ping': True}
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_recycle': 280,
+        'pool_timeout': 100,
+        'pool_pre_ping': True,
+        'pool_size': int(os.getenv('SQLALCHEMY_POOL_SIZE') or 5),
+        'max_overflow': int(os.getenv('SQLALCHEMY_MAX_OVERFLOW') or 10),
+    }
+    COOPERATIVE_WORKERS = bool(os.getenv('COOPERATIVE_WORKERS'))  # set by gevent_main; many requests share each worker's pool
     JWT_BLACKLIST_ENABLED = True  # enable blacklist feature
     JWT_BLACKLIST_TOKEN_CHECKS = ["access", "refresh"]
     SECRET_KEY = os.getenv('SECRET_KEY')
     MAIL_SERVER = os.getenv('MAIL_SERVER')
-    MAIL_PORT = int(os.getenv('MAIL_PORT'))
+    MAIL_PORT = int(os.getenv('MAIL_PORT') or 25)
     MAIL_USE_SSL = bool(os.getenv('MAIL_USE_SSL')) 
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
     MAIL_ASCII_ATTACHMENTS = bool(os.getenv('MAIL_ASCII_ATTACHMENTS'))
     DEFAULT_MAIL_SENDER = os.getenv('DEFAULT_MAIL_SENDER')
 
+    # Upstream services
+    USER_SERVICE_URL = os.getenv('USER_SERVICE_URL') or 'http://172.18.0.1:3100'  # users and logs
+    LICENSE_SERVICE_URL = os.getenv('LICENSE_SERVICE_URL') or 'http://172.18.0.1:3101'
+    UPSTREAM_TIMEOUT = (
+        float(os.getenv('UPSTREAM_CONNECT_TIMEOUT') or 3.05),
+        float(os.getenv('UPSTREAM_READ_TIMEOUT') or 10),
+    )  # seconds
+
+    # Optional integrations, only initialised when configured
+    SENTRY_DSN = os.getenv('SENTRY_DSN')
+    SENTRY_SAMPLE_RATE = float(os.getenv('SENTRY_SAMPLE_RATE') or 1.0)
+    SENTRY_TRACES_SAMPLE_RATE = float(os.getenv('SENTRY_TRACES_SAMPLE_RATE') or 0.0)
+    CREATE_TABLES = bool(os.getenv('CREATE_TABLES'))  # run db.create_all() on the first request
+
+    # Credit headroom checks
+    CREDIT_CHECK_MAX_ITEMS = int(os.getenv('CREDIT_CHECK_MAX_ITEMS') or 200)
+    CREDIT_CHECK_MAX_WORKERS = int(os.getenv('CREDIT_CHECK_MAX_WORKERS') or 4)  # parallel license lookups
+
+    # Idempotency-Key handling for POST endpoints
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL') or 86400)  # seconds a stored response is replayed for
+    IDEMPOTENCY_LEASE = int(os.getenv('IDEMPOTENCY_LEASE') or 60)  # seconds before a dead request's key can be taken over; renewed while it runs
+    IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT') or 10)  # seconds a duplicate waits
+    IDEMPOTENCY_POLL_INTERVAL = 0.2
+
+    # Archiving of credits whose license has been sold
+    CREDIT_ARCHIVE_BATCH_SIZE = int(os.getenv('CREDIT_ARCHIVE_BATCH_SIZE') or 500)
+    CREDIT_ARCHIVE_PAGE_SIZE = int(os.getenv('CREDIT_ARCHIVE_PAGE_SIZE') or 100)  # most archived credits returned per page
+    CREDIT_ARCHIVE_PARTITIONED = bool(os.getenv('CREDIT_ARCHIVE_PARTITIONED'))  # partition the archive by created month (PostgreSQL)
+    CREDIT_ARCHIVE_AUTH_TOKEN = os.getenv('CREDIT_ARCHIVE_AUTH_TOKEN')  # used by the archive-credits command
+
+    # Response compression, negotiated through Accept-Encoding
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    COMPRESS_MIMETYPES = ['application/json']
+    COMPRESS_LEVEL = 6  # gzip
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE') or 1024)
+
+    # Concurrency limits per endpoint group and upstream service, shared by all worker processes on the node
+    ADMISSION_LIMITS = {
+        'credit_read': int(os.getenv('ADMISSION_CREDIT_READ_LIMIT') or 16),
+        'credit_write': int(os.getenv('ADMISSION_CREDIT_WRITE_LIMIT') or 4),
+        'credit_check': int(os.getenv('ADMISSION_CREDIT_CHECK_LIMIT') or 4),
+        'salesman_read': int(os.getenv('ADMISSION_SALESMAN_READ_LIMIT') or 16),
+        'salesman_write': int(os.getenv('ADMISSION_SALESMAN_WRITE_LIMIT') or 4),
+        'license_service': int(os.getenv('ADMISSION_LICENSE_SERVICE_LIMIT') or 8),
+        'user_service': int(os.getenv('ADMISSION_USER_SERVICE_LIMIT') or 8),
+        'log_service': int(os.getenv('ADMISSION_LOG_SERVICE_LIMIT') or 8),
+    }
+    ADMISSION_DEFAULT_LIMIT = int(os.getenv('ADMISSION_DEFAULT_LIMIT') or 8)
+    ADMISSION_TOKEN_LIMIT = int(os.getenv('ADMISSION_TOKEN_LIMIT') or 4)  # concurrent requests per token
+    ADMISSION_TOKEN_BUCKETS = 1024  # tokens are hashed into this many quota buckets
+    ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER') or 2)  # seconds
+    ADMISSION_DIR = os.getenv('ADMISSION_DIR') or os.path.join(tempfile.gettempdir(), 'credit_management_admission')
+
+    # On-demand request profiling
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE') or 0.0)  # fraction of requests profiled at random
+    PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL') or 0.005)  # seconds between stack samples
+    PROFILE_STORE_SIZE = int(os.getenv('PROFILE_STORE_SIZE') or 50)
+    PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'credit_management_profiles')
+
+    # Budget in seconds for import plus first request, checked by startup.py
+    STARTUP_BUDGET = float(os.getenv('STARTUP_BUDGET') or 3.0)
+
 
 class Development(Config):
     ENVIRONMENT = 'Development'
     DEBUG = True
     MAIL_DEBUG = True
+    CREATE_TABLES = True
    
 class Testing (Config):
     ENVIRONMENT = 'Production'
     DEBUG = False
     MAIL_DEBUG = False
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URI') or 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # sqlite doesn't take the pool options
+    JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY') or 'testing'
+    SENTRY_DSN = None
 
     
 class Production(Config):
@@ -37,3 +113,9 @@ class Production(Config):
     DEBUG = False
     MAIL_DEBUG = False
 
+
+config_by_name = {
+    'development': Development,
+    'testing': Testing,
+    'production': Production,
+}
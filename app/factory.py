@@ -0,0 +1,63 @@
+from flask import Flask, jsonify
+from flask_compress import Compress
+from flask_cors import CORS
+from marshmallow import ValidationError
+
+from configurations import config_by_name
+from resources import blueprint, jwt
+from models import db
+from schemas import ma
+from user_functions.profiling import init_profiling
+
+compress = Compress()
+
+
+def create_app(config_name:str='development') -> Flask:
+    app = Flask(__name__)
+    app.config.from_object(config_by_name[config_name])
+
+    init_sentry(app)
+
+    CORS(app)
+    compress.init_app(app)
+    init_profiling(app)
+    app.register_blueprint(blueprint)
+    jwt.init_app(app)
+    db.init_app(app)
+    ma.init_app(app)
+
+    if app.config['CREATE_TABLES']:
+        @app.before_first_request
+        def create_tables():
+            db.create_all()
+
+    @app.cli.command('archive-credits')
+    def archive_credits():
+        '''Move credits whose license has been sold into the archive table'''
+        from user_functions.credit_archive import archive_settled_credits
+        auth_token = {"Authorization": app.config['CREDIT_ARCHIVE_AUTH_TOKEN']}
+        print(archive_settled_credits(auth_token))
+
+    @app.errorhandler(ValidationError)
+    def handle_marshmallow_validation(err):
+        return jsonify(err.messages), 400
+
+    return app
+
+
+def init_sentry(app:Flask) -> None:
+    dsn = app.config.get('SENTRY_DSN')
+    if not dsn:
+        return
+
+    # Imported here so that apps without Sentry configured don't pay for it
+    import sentry_sdk
+    from sentry_sdk.integrations.flask import FlaskIntegration
+
+    sentry_sdk.init(
+        dsn=dsn,
+        environment=app.config['ENVIRONMENT'],
+        sample_rate=app.config['SENTRY_SAMPLE_RATE'],
+        traces_sample_rate=app.config['SENTRY_TRACES_SAMPLE_RATE'],
+        integrations=[FlaskIntegration()]
+    )
@@ -0,0 +1,20 @@
+# Entry point for the gevent worker mode (uwsgi_gevent.ini). Patch before anything
+# else is imported so upstream and database calls yield to other requests.
+from gevent import monkey
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg
+patch_psycopg()
+
+import os
+
+os.environ.setdefault('COOPERATIVE_WORKERS', '1')
+
+from factory import create_app
+
+app = create_app(os.getenv('APP_CONFIG', 'development'))
+
+
+if __name__ == '__main__':
+    from gevent.pywsgi import WSGIServer
+    WSGIServer(('0.0.0.0', 3103), app).serve_forever()
@@ -1,4 +1,49 @@
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 db = SQLAlchemy()
 
+
+# Track the writes sent to the database, including ones autoflushed by a query,
+# which no longer show up in session.new/dirty
+@event.listens_for(Session, 'after_flush')
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _after_write(*args):
+    session = args[0] if isinstance(args[0], Session) else args[0].session
+    session.info['has_writes'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    if session.info.pop('has_writes', None):
+        session.info['committed_writes'] = session.info.get('committed_writes', 0) + 1
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('has_writes', None)
+
+
+def committed_writes() -> int:
+    '''Return how many transactions with writes the current session has committed'''
+    return db.session().info.get('committed_writes', 0)
+
+
+def release_connection() -> None:
+    '''Give the session's connection back to the pool before waiting on something slow'''
+    # Only in the gevent worker mode, where other requests in the process need the connection
+    if not has_app_context() or not current_app.config.get('COOPERATIVE_WORKERS'):
+        return
+    session = db.session()
+    if session.new or session.dirty or session.deleted or session.info.get('has_writes'):
+        return
+    # Commit the read-only transaction without expiring the objects loaded in it
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
@@ -1,6 +1,8 @@
 from datetime import datetime
 from typing import List
 
+from sqlalchemy.orm import load_only
+
 from . import db
 
 class CreditModel(db.Model):
@@ -9,20 +11,34 @@ class CreditModel(db.Model):
     salesman_id = db.Column(db.Integer, db.ForeignKey('salesmen.id'), nullable=False)
     salesman = db.relationship('SalesmanModel')
     license_id = db.Column(db.Integer, unique=True, nullable=False)
-    created = db.Column(db.DateTime, default=datetime.utcnow(), nullable=False)
-    updated = db.Column(db.DateTime, onupdate=datetime.utcnow(), nullable=True)
+    created = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated = db.Column(db.DateTime, onupdate=datetime.utcnow, nullable=True)
 
     def insert_record(self) -> None:
         db.session.add(self)
         db.session.commit()
 
     @classmethod
-    def fetch_all(cls) -> List['CreditModel']:
-        return cls.query.order_by(cls.id.asc()).all()
+    def fetch_all(cls, columns:tuple=None) -> List['CreditModel']:
+        query = cls.query
+        if columns:
+            query = query.options(load_only(*columns))
+        return query.order_by(cls.id.asc()).all()
+
+    @classmethod
+    def fetch_by_salesman_id(cls, salesman_id:int, columns:tuple=None) -> List ['CreditModel']:
+        query = cls.query
+        if columns:
+            query = query.options(load_only(*columns))
+        return query.filter_by(salesman_id=salesman_id).all()
 
     @classmethod
-    def fetch_by_salesman_id(cls, salesman_id:int) -> List ['CreditModel']:
-        return cls.query.filter_by(salesman_id=salesman_id).all()
+    def fetch_by_salesman_ids(cls, salesman_ids:List[int]) -> List['CreditModel']:
+        return cls.query.filter(cls.salesman_id.in_(salesman_ids)).all()
+
+    @classmethod
+    def fetch_batch(cls, after_id:int, size:int) -> List['CreditModel']:
+        return cls.query.filter(cls.id > after_id).order_by(cls.id.asc()).limit(size).all()
 
     @classmethod
     def fetch_by_id(cls, id:int) -> 'CreditModel':
@@ -32,6 +48,10 @@ class CreditModel(db.Model):
     def fetch_by_license_id(cls, license_id:int) -> 'CreditModel':
         return cls.query.filter_by(license_id=license_id).first()
 
+    @classmethod
+    def fetch_by_license_ids(cls, license_ids:List[int]) -> List['CreditModel']:
+        return cls.query.filter(cls.license_id.in_(license_ids)).all()
+
     @classmethod
     def delete_by_id(cls, id:int) -> None:
         record = cls.query.filter_by(id=id)
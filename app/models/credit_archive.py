@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import List
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+
+from . import db
+
+class CreditArchiveModel(db.Model):
+    '''Credits whose license has been sold, moved out of salesman_credits by the archive job'''
+    __tablename__ = 'salesman_credits_archive'
+    # The partition key has to be part of the primary key, so it is (id, created) either way
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    created = db.Column(db.DateTime, primary_key=True, nullable=False)
+    salesman_id = db.Column(db.Integer, nullable=False, index=True)
+    license_id = db.Column(db.Integer, nullable=False, index=True)
+    updated = db.Column(db.DateTime, nullable=True)
+    archived = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @classmethod
+    def fetch_all(cls) -> List['CreditArchiveModel']:
+        return cls.query.order_by(cls.id.asc()).all()
+
+    @classmethod
+    def fetch_page(cls, after_id:int, limit:int, salesman_id:int=None) -> List['CreditArchiveModel']:
+        '''Return up to `limit` archived credits with an id above `after_id`, optionally for one salesman'''
+        query = cls.query.filter(cls.id > after_id)
+        if salesman_id is not None:
+            query = query.filter_by(salesman_id=salesman_id)
+        return query.order_by(cls.id.asc()).limit(limit).all()
+
+    @classmethod
+    def fetch_by_license_id(cls, license_id:int) -> 'CreditArchiveModel':
+        return cls.query.filter_by(license_id=license_id).first()
+
+    @classmethod
+    def ensure_partitions(cls, months:List[datetime]) -> None:
+        '''Create the monthly partitions that rows created in the given months will go to'''
+        if not current_app.config['CREDIT_ARCHIVE_PARTITIONED'] or db.engine.dialect.name != 'postgresql':
+            return
+        for month in sorted({datetime(month.year, month.month, 1) for month in months}):
+            next_month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+            db.session.execute(text(
+                f'CREATE TABLE IF NOT EXISTS {cls.__tablename__}_{month:%Y_%m} '
+                f'PARTITION OF {cls.__tablename__} '
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')"
+            ))
+
+
+@event.listens_for(CreditArchiveModel.__table__, 'before_create')
+def _partition_by_created(table, connection, **kwargs):
+    # Decided when the table is created, so the app's config applies rather than the environment at import
+    partitioned = has_app_context() and current_app.config.get('CREDIT_ARCHIVE_PARTITIONED')
+    table.dialect_kwargs['postgresql_partition_by'] = 'RANGE (created)' if partitioned else None
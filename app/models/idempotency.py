@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from . import db
+
+class IdempotencyKeyModel(db.Model):
+    __tablename__ = 'idempotency_keys'
+    key = db.Column(db.String(255), primary_key=True) # <user id>:<path>:<Idempotency-Key header>
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='in_progress') # in_progress or completed
+    response_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = db.Column(db.DateTime, nullable=False) # lease of the request running it, while in_progress
+    expires = db.Column(db.DateTime, nullable=False, index=True)
+
+    def insert_record(self) -> None:
+        db.session.add(self)
+        db.session.commit()
+
+    @classmethod
+    def fetch_by_key(cls, key:str) -> 'IdempotencyKeyModel':
+        return cls.query.filter_by(key=key).first()
+
+    @classmethod
+    def take_over(cls, key:str, locked_until:datetime) -> bool:
+        record = cls.query.filter(cls.key == key, cls.status == 'in_progress', cls.locked_until < datetime.utcnow())
+        taken = record.update({'locked_until': locked_until}, synchronize_session=False)
+        db.session.commit()
+        return taken == 1
+
+    @classmethod
+    def renew(cls, key:str, locked_until:datetime) -> None:
+        record = cls.query.filter_by(key=key, status='in_progress')
+        record.update({'locked_until': locked_until}, synchronize_session=False)
+        db.session.commit()
+
+    @classmethod
+    def complete(cls, key:str, response_code:int, response_body:str) -> None:
+        record = cls.fetch_by_key(key)
+        if record:
+            record.status = 'completed'
+            record.response_code = response_code
+            record.response_body = response_body
+        db.session.commit()
+
+    @classmethod
+    def delete_by_key(cls, key:str) -> None:
+        record = cls.query.filter_by(key=key)
+        record.delete()
+        db.session.commit()
+
+    @classmethod
+    def delete_expired(cls) -> None:
+        record = cls.query.filter(cls.expires < datetime.utcnow())
+        record.delete(synchronize_session=False)
+        db.session.commit()
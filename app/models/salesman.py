@@ -1,6 +1,8 @@
 from datetime import datetime
 from typing import List
 
+from sqlalchemy.orm import load_only, selectinload
+
 from . import db
 
 class SalesmanModel(db.Model):
@@ -9,23 +11,36 @@ class SalesmanModel(db.Model):
     user_id = db.Column(db.Integer, nullable=False, unique=True)
     limit = db.Column(db.Float(precision=2), nullable=False)
     is_suspended = db.Column(db.Integer, nullable=False, default=0) # 0 is false, 1 is true, 2 is restored
-    created = db.Column(db.DateTime, default=datetime.utcnow(), nullable=False)
-    updated = db.Column(db.DateTime, onupdate=datetime.utcnow(), nullable=True)
+    created = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated = db.Column(db.DateTime, onupdate=datetime.utcnow, nullable=True)
 
-    salesman_credits = db.relationship('CreditModel', lazy='dynamic')
+    salesman_credits = db.relationship('CreditModel', lazy='select')
 
     def insert_record(self) -> None:
         db.session.add(self)
         db.session.commit()
 
     @classmethod
-    def fetch_all(cls) -> List['SalesmanModel']:
-        return cls.query.order_by(cls.id.desc()).all()
+    def fetch_all(cls, columns:tuple=None, credit_columns:tuple=None) -> List['SalesmanModel']:
+        # credit_columns=None leaves the credits unloaded, () loads them whole, in one query either way
+        query = cls.query
+        if columns:
+            query = query.options(load_only(*columns))
+        if credit_columns is not None:
+            credits = selectinload(cls.salesman_credits)
+            if credit_columns:
+                credits = credits.load_only(*credit_columns, 'salesman_id')
+            query = query.options(credits)
+        return query.order_by(cls.id.desc()).all()
 
     @classmethod
     def fetch_by_id(cls, id:int) -> 'SalesmanModel':
         return cls.query.get(id)
 
+    @classmethod
+    def fetch_by_ids(cls, ids:List[int]) -> List['SalesmanModel']:
+        return cls.query.filter(cls.id.in_(ids)).all()
+
     @classmethod
     def fetch_by_user_id(cls, user_id:int) -> 'SalesmanModel':
         return cls.query.filter_by(user_id=user_id).first()
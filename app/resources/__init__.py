@@ -5,6 +5,8 @@ from flask_jwt_extended import JWTManager
 from blacklist import BLACKLIST
 from .salesmen import api as salesmen
 from .credit import api as credit
+from .admission import api as admission
+from .debug import api as debug
 
 jwt = JWTManager()
 
@@ -22,6 +24,8 @@ api = Api(blueprint, doc='/documentation', title='Credit management API', versio
 
 api.add_namespace(salesmen)
 api.add_namespace(credit)
+api.add_namespace(admission)
+api.add_namespace(debug)
 
 @jwt.user_claims_loader
 # Remember identity is what we define when creating the access token
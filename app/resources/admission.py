@@ -0,0 +1,20 @@
+from flask_restx import Namespace, Resource
+from flask_jwt_extended import jwt_required, get_jwt_claims
+
+from user_functions.admission_control import admission_stats
+
+api = Namespace('admission', description='Admission Control Statistics')
+
+# - '/admission'
+# get concurrency limits and rejection counts - Admin
+@api.route('')
+class AdmissionStats(Resource):
+    @classmethod
+    @api.doc('Get admission control statistics')
+    @jwt_required
+    def get(cls):
+        '''Get Admission Control Statistics'''
+        claims = get_jwt_claims()
+        if not claims['is_admin']:
+            return {'message': 'You are not allowed to access this resource'}, 403
+        return admission_stats(), 200
@@ -1,24 +1,35 @@
 import requests
-from flask import request
+from flask import request, current_app
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt_claims
 
 from models.credit import CreditModel
 from models.salesman import SalesmanModel
+from models.credit_archive import CreditArchiveModel
 from schemas.credit import CreditSchema
+from schemas.credit_archive import CreditArchiveSchema
 from user_functions.record_user_log import record_user_log
-from user_functions.credit_functions import license_existence, price_fetcher
+from user_functions.credit_functions import license_existence, fetch_prices, credit_exposure, exceeds_limit
+from user_functions.credit_archive import archive_settled_credits
+from user_functions.admission_control import admit, upstream, busy_response, UpstreamUnavailable
+from user_functions.idempotency import idempotent
+from user_functions.field_selection import requested_fields, schema_for, load_columns, InvalidFields
+from user_functions.pagination import page_args, InvalidPage
 
 api = Namespace('credit', description='Credits Management')
 
 credit_schema = CreditSchema()
-credit_schemas = CreditSchema(many=True)
+credit_archive_schemas = CreditArchiveSchema(many=True)
 
 credit_model = api.model('Credit', {
     'salesman_id': fields.Integer(required=True, description='Salesman ID'),
     'license_id': fields.Integer(required=True, description='License ID')
 })
 
+credit_check_model = api.model('CreditCheck', {
+    'items': fields.List(fields.Nested(credit_model), required=True, description='Candidate credits')
+})
+
 # '/'
 # get all credits - Admin
 # post credit - Admin, SalesMan
@@ -27,13 +38,16 @@ class CreditList(Resource):
     @classmethod
     @api.doc('Get all credits')
     @jwt_required
+    @admit('credit_read')
     def get(cls):
         '''Get All Credits'''
         claims = get_jwt_claims()
         if not claims['is_admin']:
             return {'message': 'You are not allowed to access this resource'}, 403
         try:
-            salesman_credits = CreditModel.fetch_all()
+            fields = requested_fields()
+            schema = schema_for(CreditSchema, fields, many=True)
+            salesman_credits = CreditModel.fetch_all(columns=load_columns(CreditModel, fields))
             if salesman_credits:
 
                 # Record this event in user's logs
@@ -43,8 +57,10 @@ class CreditList(Resource):
                 auth_token  = { "Authorization": authorization}
                 record_user_log(auth_token, log_method, log_description)
 
-                return credit_schemas.dump(salesman_credits), 200
+                return schema.dump(salesman_credits), 200
             return {'message':'There are no credits recorded yet.'}, 404           
+        except InvalidFields as e:
+            return {'message': str(e)}, 400
         except Exception as e:
             print('========================================')
             print('Error description: ', e)
@@ -54,6 +70,8 @@ class CreditList(Resource):
     @classmethod
     @api.doc('Post credit item')
     @jwt_required
+    @idempotent
+    @admit('credit_write')
     @api.expect(credit_model)
     def post(cls):
         '''Post Credit Item'''
@@ -87,22 +105,18 @@ class CreditList(Resource):
                 # if sum(credits.limits) + license['price'] - sales.payments.amount > salesman.limit
                 #     return {'message':'Submission Denied. You cannot add credits if they will pass the limit.'}, 400
                 salesman_credits = CreditModel.fetch_by_salesman_id(salesman_id)
-                if salesman_credits:
-                    license_prices = []
-                    for credit in salesman_credits:
-                        license_key = credit.license_id
-                        price_response = price_fetcher(auth_token, license_key)
-                        if 'license_key' in price_response.keys():
-                            if price_response['license_status'] == 'on_credit':
-                                price = float(price_response['price'])
-                                print('Append')
-                                license_prices.append(price)
-                                print('Append True')
-                        else:
-                            return price_response['message'], price_response['status_code']
-                    if sum(license_prices) + float(license_response['price']) > salesman.limit:
-                        return {'message': 'Could not add credit item. Adding this item will exceed the salesman limits.'}, 400
-                    
+                licenses = fetch_prices(
+                    auth_token,
+                    [credit.license_id for credit in salesman_credits],
+                    max_workers=current_app.config['CREDIT_CHECK_MAX_WORKERS']
+                )
+                for price_response in licenses.values():
+                    if 'license_key' not in price_response.keys():
+                        return price_response['message'], price_response['status_code']
+                exposure = credit_exposure(salesman_credits, licenses)
+                if exceeds_limit(exposure, float(license_response['price']), salesman.limit):
+                    return {'message': 'Could not add credit item. Adding this item will exceed the salesman limits.'}, 400
+
                 # Add credit record to database
                 new_credit_record = CreditModel(salesman_id=salesman_id, license_id=license_id)
                 new_credit_record.insert_record()
@@ -112,14 +126,17 @@ class CreditList(Resource):
                 log_description = f'Added new credit record to salesman <{salesman_id}>'           
                 record_user_log(auth_token, log_method, log_description)
 
-                credit_license_url = f'http://172.18.0.1:3101/api/license/credit/{license_id}'
-                res = requests.put(credit_license_url, headers=auth_token)
+                credit_license_url = f"{current_app.config['LICENSE_SERVICE_URL']}/api/license/credit/{license_id}"
+                with upstream('license_service'):
+                    res = requests.put(credit_license_url, headers=auth_token, timeout=current_app.config['UPSTREAM_TIMEOUT'])
                 if res.status_code != 200:    
                     return {'message':{1:'Updated credits but was unable to set license status to on credit.', 2:res.json()}}, res.status_code
                 
                 license_record = CreditModel.fetch_by_license_id(license_id)
                 return credit_schema.dump(license_record), 201
             return {'message': 'The specified salesman does not exist'}, 404            
+        except UpstreamUnavailable as e:
+            return busy_response(f'The {e.name} service is busy. Please retry later.')
         except Exception as e:
             print('========================================')
             print('Error description: ', e)
@@ -127,6 +144,109 @@ class CreditList(Resource):
             return {'message': 'Could not post credit item'}, 500
         
 
+# - '/check'
+# check which candidate credits fit under the salesmen limits, without writing - Admin
+@api.route('/check')
+class CreditCheck(Resource):
+    @classmethod
+    @api.doc('Check credit headroom')
+    @jwt_required
+    @admit('credit_check')
+    @api.expect(credit_check_model)
+    def post(cls):
+        '''Check Credit Headroom'''
+        claims = get_jwt_claims()
+        if not claims['is_admin']:
+            return {'message': 'You are not allowed to access this resource'}, 403
+        try:
+            data = api.payload
+            if not data or not data.get('items'):
+                return {'message':'No input data detected.'}, 400
+
+            items = data['items']
+            if len(items) > current_app.config['CREDIT_CHECK_MAX_ITEMS']:
+                return {'message': f"You can check at most {current_app.config['CREDIT_CHECK_MAX_ITEMS']} items at a time."}, 400
+            try:
+                items = [(int(item['salesman_id']), int(item['license_id'])) for item in items]
+            except (KeyError, TypeError, ValueError):
+                return {'message': 'Each item needs an integer salesman_id and license_id.'}, 400
+
+            salesman_ids = list({salesman_id for salesman_id, _ in items})
+            candidate_ids = list({license_id for _, license_id in items})
+
+            salesmen = {salesman.id: salesman for salesman in SalesmanModel.fetch_by_ids(salesman_ids)}
+            open_credits = CreditModel.fetch_by_salesman_ids(list(salesmen))
+            credited_ids = {credit.license_id for credit in CreditModel.fetch_by_license_ids(candidate_ids)}
+
+            # Look up every license involved once, in parallel
+            authorization = request.headers.get('Authorization')
+            auth_token  = { "Authorization": authorization}
+            licenses = fetch_prices(
+                auth_token,
+                [credit.license_id for credit in open_credits] + candidate_ids,
+                max_workers=current_app.config['CREDIT_CHECK_MAX_WORKERS']
+            )
+
+            # Current exposure of each salesman, worked out the same way as CreditList.post
+            credits_by_salesman = {salesman_id: [] for salesman_id in salesmen}
+            for credit in open_credits:
+                credits_by_salesman[credit.salesman_id].append(credit)
+            exposure = {salesman_id: credit_exposure(credits, licenses) for salesman_id, credits in credits_by_salesman.items()}
+            current_exposure = dict(exposure)
+
+            results = []
+            checked_ids = set()
+            for salesman_id, license_id in items:
+                result = {'salesman_id': salesman_id, 'license_id': license_id, 'accepted': False}
+                license_key = licenses[license_id]
+                salesman = salesmen.get(salesman_id)
+                if not salesman:
+                    result['message'] = 'The specified salesman does not exist'
+                elif license_id in credited_ids or license_id in checked_ids:
+                    result['message'] = 'This license has already been credited.'
+                elif 'license_key' not in license_key.keys():
+                    result['message'] = license_key['message']
+                elif license_key['license_status'] in ('on_credit', 'sold'):
+                    result['message'] = 'This license is not available for crediting. It has either already sold or on credit.'
+                elif exposure[salesman_id] is None:
+                    result['message'] = 'Could not determine the current credit exposure of this salesman.'
+                else:
+                    price = float(license_key['price'])
+                    result['price'] = price
+                    if exceeds_limit(exposure[salesman_id], price, salesman.limit):
+                        result['message'] = 'Adding this item will exceed the salesman limits.'
+                    else:
+                        # Later items for the same salesman are checked against the reduced headroom
+                        exposure[salesman_id] += price
+                        checked_ids.add(license_id)
+                        result['accepted'] = True
+                results.append(result)
+
+            headroom = []
+            for salesman_id, salesman in salesmen.items():
+                headroom.append({
+                    'salesman_id': salesman_id,
+                    'limit': salesman.limit,
+                    'exposure': current_exposure[salesman_id],
+                    'headroom': None if current_exposure[salesman_id] is None else salesman.limit - current_exposure[salesman_id],
+                    'headroom_after_accepted': None if exposure[salesman_id] is None else salesman.limit - exposure[salesman_id]
+                })
+
+            # Record this event in user's logs
+            log_method = 'post'
+            log_description = f'Checked credit headroom for {len(items)} items'
+            record_user_log(auth_token, log_method, log_description)
+
+            return {'items': results, 'salesmen': headroom}, 200
+        except UpstreamUnavailable as e:
+            return busy_response(f'The {e.name} service is busy. Please retry later.')
+        except Exception as e:
+            print('========================================')
+            print('Error description: ', e)
+            print('========================================')
+            return {'message': 'Could not check credit items'}, 500
+
+
 # - '/<int:id>'
 # get one credit - Admin, SalesMan
 # delete credit - Admin
@@ -136,12 +256,14 @@ class CreditDetail(Resource):
     @classmethod
     @api.doc('Get specific credit')
     @jwt_required
+    @admit('credit_read')
     def get(cls, id:int):
         '''Get Specific Credit'''
         claims = get_jwt_claims()
         authorised_user = get_jwt_identity()
         this_user = authorised_user['id']
         try:
+            schema = schema_for(CreditSchema, requested_fields())
             salesman_credit = CreditModel.fetch_by_id(id)
             if salesman_credit:
                 user = salesman_credit.salesman.user_id
@@ -153,10 +275,12 @@ class CreditDetail(Resource):
                     authorization = request.headers.get('Authorization')
                     auth_token  = { "Authorization": authorization}
                     record_user_log(auth_token, log_method, log_description)
-                    return credit_schema.dump(salesman_credit), 200
+                    return schema.dump(salesman_credit), 200
                 return {'message':'You are not authorised to fetch this record'}, 403
             return {'message':'This record does not exist.'}, 404
 
+        except InvalidFields as e:
+            return {'message': str(e)}, 400
         except Exception as e:
             print('========================================')
             print('Error description: ', e)
@@ -166,6 +290,7 @@ class CreditDetail(Resource):
     @classmethod
     @api.doc('Delete credits')
     @jwt_required
+    @admit('credit_write')
     def delete(cls, id:int):
         '''Delete Credit'''
         claims = get_jwt_claims()
@@ -184,16 +309,20 @@ class CreditDetail(Resource):
                 auth_token  = { "Authorization": authorization}
                 record_user_log(auth_token, log_method, log_description)
 
-                sales_url = f'http://172.18.0.1:3101/api/license_sale/license/{id}'
-                req = requests.get(sales_url, headers=auth_token)
+                sales_url = f"{current_app.config['LICENSE_SERVICE_URL']}/api/license_sale/license/{id}"
+                with upstream('license_service'):
+                    req = requests.get(sales_url, headers=auth_token, timeout=current_app.config['UPSTREAM_TIMEOUT'])
                 if req.status_code == 404:
-                    credit_license_url = f'http://172.18.0.1:3101/api/license/avail/{license_id}'
-                    res = requests.post(credit_license_url, headers=auth_token)
+                    credit_license_url = f"{current_app.config['LICENSE_SERVICE_URL']}/api/license/avail/{license_id}"
+                    with upstream('license_service'):
+                        res = requests.post(credit_license_url, headers=auth_token, timeout=current_app.config['UPSTREAM_TIMEOUT'])
                     if req.status_code != 200:    
                         return {'message':{1:'Deleted credit but was unable to avail license status.', 2:req.json()}}, req.status_code
 
                 return {'message':'Successfully deleted Credit record'}, 200
             return {'message':'This record does not exist.'}, 404 
+        except UpstreamUnavailable as e:
+            return busy_response(f'The {e.name} service is busy. Please retry later.')
         except Exception as e:
             print('========================================')
             print('Error description: ', e)
@@ -208,17 +337,23 @@ class CreditBySalesman(Resource):
     @classmethod
     @api.doc('Get credits by salesman')
     @jwt_required
+    @admit('credit_read')
     def get(cls, salesman_id:int):
         '''Get Credits By Salesman'''
         claims = get_jwt_claims()
         authorised_user = get_jwt_identity()
-        
-        salesman_credits = CreditModel.fetch_by_salesman_id(salesman_id)
-        if salesman_credits:
-            this_user = authorised_user['id']
-            salesman = salesman_credits.salesman.user_id # SalesmanModel.fetch_by_id(id=salesman_id)
-            user = salesman.user_id
-            if user == this_user or claims['is_admin']:
+
+        try:
+            fields = requested_fields()
+            schema = schema_for(CreditSchema, fields, many=True)
+            salesman = SalesmanModel.fetch_by_id(salesman_id)
+            if not salesman:
+                return {'message': 'The specified salesman does not exist'}, 404
+            if salesman.user_id != authorised_user['id'] and not claims['is_admin']:
+                return {'message':'You are not authorised to access this resource'}, 403
+
+            salesman_credits = CreditModel.fetch_by_salesman_id(salesman_id, columns=load_columns(CreditModel, fields))
+            if salesman_credits:
 
                 # Record this event in user's logs
                 log_method = 'get'
@@ -226,6 +361,130 @@ class CreditBySalesman(Resource):
                 authorization = request.headers.get('Authorization')
                 auth_token  = { "Authorization": authorization}
                 record_user_log(auth_token, log_method, log_description)
-                return credit_schemas.dump(salesman_credits), 200
-            return {'message':'You are not authorised to access this resource'}, 403
-        return {'message':'There are no credits yet.'}, 404
+                return schema.dump(salesman_credits), 200
+            return {'message':'There are no credits yet.'}, 404
+        except InvalidFields as e:
+            return {'message': str(e)}, 400
+        except Exception as e:
+            print('========================================')
+            print('Error description: ', e)
+            print('========================================')
+            return {'message': 'Could not fetch credits'}, 500
+
+# - '/archive'
+# get archived credits - Admin
+# archive credits whose license has been sold - Admin
+@api.route('/archive')
+class CreditArchiveList(Resource):
+    @classmethod
+    @api.doc('Get archived credits', params={
+        'limit': 'Most archived credits to return, up to CREDIT_ARCHIVE_PAGE_SIZE',
+        'after_id': 'Return archived credits with an id above this one'
+    })
+    @jwt_required
+    @admit('credit_read')
+    def get(cls):
+        '''Get Archived Credits'''
+        claims = get_jwt_claims()
+        if not claims['is_admin']:
+            return {'message': 'You are not allowed to access this resource'}, 403
+        try:
+            after_id, limit = page_args(current_app.config['CREDIT_ARCHIVE_PAGE_SIZE'])
+            archived_credits = CreditArchiveModel.fetch_page(after_id, limit)
+            if archived_credits:
+
+                # Record this event in user's logs
+                log_method = 'get'
+                log_description = 'Fetched all archived credits'
+                authorization = request.headers.get('Authorization')
+                auth_token  = { "Authorization": authorization}
+                record_user_log(auth_token, log_method, log_description)
+
+                return credit_archive_schemas.dump(archived_credits), 200
+            return {'message':'There are no archived credits yet.'}, 404
+        except InvalidPage as e:
+            return {'message': str(e)}, 400
+        except Exception as e:
+            print('========================================')
+            print('Error description: ', e)
+            print('========================================')
+            return {'message': 'Could not fetch archived credits'}, 500
+
+    @classmethod
+    @api.doc('Archive settled credits', params={
+        'limit': 'Most credits to scan, up to CREDIT_ARCHIVE_BATCH_SIZE',
+        'after_id': 'Scan credits with an id above this one; pass the next_after_id of the previous call'
+    })
+    @jwt_required
+    @admit('credit_write')
+    def post(cls):
+        '''Archive Settled Credits'''
+        claims = get_jwt_claims()
+        if not claims['is_admin']:
+            return {'message': 'You are not allowed to access this resource'}, 403
+        try:
+            # One batch per request so the request stays short; full runs use the archive-credits command
+            after_id, limit = page_args(current_app.config['CREDIT_ARCHIVE_BATCH_SIZE'])
+            authorization = request.headers.get('Authorization')
+            auth_token  = { "Authorization": authorization}
+            summary = archive_settled_credits(auth_token, batch_size=limit, after_id=after_id, max_batches=1)
+
+            # Record this event in user's logs
+            log_method = 'post'
+            log_description = f"Archived {summary['archived']} settled credits"
+            record_user_log(auth_token, log_method, log_description)
+
+            return summary, 200
+        except InvalidPage as e:
+            return {'message': str(e)}, 400
+        except UpstreamUnavailable as e:
+            return busy_response(f'The {e.name} service is busy. Please retry later.')
+        except Exception as e:
+            print('========================================')
+            print('Error description: ', e)
+            print('========================================')
+            return {'message': 'Could not archive credits'}, 500
+
+# - '/archive/salesman/<int:salesman_id>'
+# get archived credits by salesman - Admin, SalesMan
+@api.route('/archive/salesman/<int:salesman_id>')
+@api.param('salesman_id', 'The salesman identifier')
+class CreditArchiveBySalesman(Resource):
+    @classmethod
+    @api.doc('Get archived credits by salesman', params={
+        'limit': 'Most archived credits to return, up to CREDIT_ARCHIVE_PAGE_SIZE',
+        'after_id': 'Return archived credits with an id above this one'
+    })
+    @jwt_required
+    @admit('credit_read')
+    def get(cls, salesman_id:int):
+        '''Get Archived Credits By Salesman'''
+        claims = get_jwt_claims()
+        authorised_user = get_jwt_identity()
+        try:
+            salesman = SalesmanModel.fetch_by_id(salesman_id)
+            if not salesman:
+                return {'message': 'The specified salesman does not exist'}, 404
+            if salesman.user_id != authorised_user['id'] and not claims['is_admin']:
+                return {'message':'You are not authorised to access this resource'}, 403
+
+            after_id, limit = page_args(current_app.config['CREDIT_ARCHIVE_PAGE_SIZE'])
+            archived_credits = CreditArchiveModel.fetch_page(after_id, limit, salesman_id=salesman_id)
+            if archived_credits:
+
+                # Record this event in user's logs
+                log_method = 'get'
+                log_description = f'Fetched archived credit records by salesman <{salesman_id}>'
+                authorization = request.headers.get('Authorization')
+                auth_token  = { "Authorization": authorization}
+                record_user_log(auth_token, log_method, log_description)
+
+                return credit_archive_schemas.dump(archived_credits), 200
+            return {'message':'There are no archived credits for this salesman.'}, 404
+        except InvalidPage as e:
+            return {'message': str(e)}, 400
+        except Exception as e:
+            print('========================================')
+            print('Error description: ', e)
+            print('========================================')
+            return {'message': 'Could not fetch archived credits'}, 500
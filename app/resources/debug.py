@@ -0,0 +1,52 @@
+import re
+
+from flask import request, make_response
+from flask_restx import Namespace, Resource
+from flask_jwt_extended import jwt_required, get_jwt_claims
+
+from user_functions.profiling import fetch_profiles, fetch_profile, folded_stacks
+
+api = Namespace('debug', description='Request Profiles')
+
+# - '/debug/profiles'
+# get recent request profiles - Admin
+@api.route('/profiles')
+class ProfileList(Resource):
+    @classmethod
+    @api.doc('Get recent profiles')
+    @jwt_required
+    def get(cls):
+        '''Get Recent Profiles'''
+        claims = get_jwt_claims()
+        if not claims['is_admin']:
+            return {'message': 'You are not allowed to access this resource'}, 403
+        profiles = fetch_profiles()
+        if profiles:
+            return profiles, 200
+        return {'message': 'There are no profiles recorded yet.'}, 404
+
+# - '/debug/profiles/<profile_id>'
+# get one profile as JSON, or as folded stacks with ?format=folded - Admin
+@api.route('/profiles/<string:profile_id>')
+@api.param('profile_id', 'The profile identifier')
+@api.param('format', 'json (default) or folded, for flamegraph.pl and speedscope')
+class ProfileDetail(Resource):
+    @classmethod
+    @api.doc('Get specific profile')
+    @jwt_required
+    def get(cls, profile_id:str):
+        '''Get Specific Profile'''
+        claims = get_jwt_claims()
+        if not claims['is_admin']:
+            return {'message': 'You are not allowed to access this resource'}, 403
+        if not re.fullmatch('[0-9a-f]{32}', profile_id):
+            return {'message': 'This profile does not exist.'}, 404
+
+        profile = fetch_profile(profile_id)
+        if not profile:
+            return {'message': 'This profile does not exist.'}, 404
+        if request.args.get('format') == 'folded':
+            response = make_response(folded_stacks(profile))
+            response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            return response
+        return profile, 200
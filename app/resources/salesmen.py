@@ -1,11 +1,15 @@
 import requests
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt_claims
-from flask import request
+from flask import request, current_app
 
 from models.salesman import SalesmanModel
+from models.credit import CreditModel
 from schemas.salesman import SalesmanSchema
 from user_functions.record_user_log import record_user_log
+from user_functions.admission_control import admit, upstream, busy_response, UpstreamUnavailable
+from user_functions.idempotency import idempotent
+from user_functions.field_selection import requested_fields, schema_for, load_columns, nested_load_columns, InvalidFields
 
 api = Namespace('salesman',description='Salesman Management')
 
@@ -20,7 +24,6 @@ edit_salesman_model = api.model('SalesmanEdit', {
 
 
 salesman_schema = SalesmanSchema()
-salesmen_schema = SalesmanSchema(many=True)
 
 
 
@@ -30,6 +33,7 @@ salesmen_schema = SalesmanSchema(many=True)
 class SalesmanList(Resource):
     @classmethod
     @jwt_required
+    @admit('salesman_read')
     @api.doc('Fetch salesmen')
     def get(cls):
         '''Fetch Salesmen'''
@@ -37,7 +41,12 @@ class SalesmanList(Resource):
         if not claims['is_admin']:
             return {'message': 'You are not allowed to access this resource'}, 403
         try:
-            salesmen = SalesmanModel.fetch_all()
+            fields = requested_fields()
+            schema = schema_for(SalesmanSchema, fields, many=True)
+            salesmen = SalesmanModel.fetch_all(
+                columns=load_columns(SalesmanModel, fields),
+                credit_columns=nested_load_columns(CreditModel, fields, 'salesman_credits')
+            )
             if salesmen:
                 # Record this event in user's logs
                 log_method = 'get'
@@ -46,8 +55,10 @@ class SalesmanList(Resource):
                 auth_token  = { "Authorization": authorization}
                 record_user_log(auth_token, log_method, log_description)
 
-                return salesmen_schema.dump(salesmen), 200
+                return schema.dump(salesmen), 200
             return {'message': 'There are no salesmen registered yet!'}, 404     
+        except InvalidFields as e:
+            return {'message': str(e)}, 400
         except Exception as e:
             print('========================================')
             print('Error description: ', e)
@@ -56,6 +67,8 @@ class SalesmanList(Resource):
 
     @classmethod
     @jwt_required
+    @idempotent
+    @admit('salesman_write')
     @api.doc('register_salesman')
     @api.expect(salesman_model)
     def post(cls):
@@ -73,8 +86,9 @@ class SalesmanList(Resource):
             authorization = request.headers.get('Authorization')
             auth_token  = {"Authorization": authorization}
 
-            url = f'http://172.18.0.1:3100/api/user/{user_id}'# 172.18.0.3
-            req = requests.get(url, headers=auth_token)
+            url = f"{current_app.config['USER_SERVICE_URL']}/api/user/{user_id}"
+            with upstream('user_service'):
+                req = requests.get(url, headers=auth_token, timeout=current_app.config['UPSTREAM_TIMEOUT'])
             if req.status_code != 200:    
                 return req.json(), req.status_code
 
@@ -91,6 +105,8 @@ class SalesmanList(Resource):
             log_description = 'Added salesman'
             record_user_log(auth_token, log_method, log_description)
             return salesman_schema.dump(salesman), 200
+        except UpstreamUnavailable as e:
+            return busy_response(f'The {e.name} service is busy. Please retry later.')
         except Exception as e:
             print('========================================')
             print('Error description: ', e)
@@ -106,6 +122,7 @@ class SalesmanList(Resource):
 class SalesmanDetail(Resource):
     @classmethod
     @jwt_required
+    @admit('salesman_read')
     @api.doc('Get one salesman')
     def get(cls, id:int):
         '''Get one Salesman'''
@@ -113,6 +130,7 @@ class SalesmanDetail(Resource):
             authorised_user = get_jwt_identity()
             claims = get_jwt_claims()
 
+            schema = schema_for(SalesmanSchema, requested_fields())
             salesman = SalesmanModel.fetch_by_id(id)
             if salesman:
                 if authorised_user['id'] == salesman.id or claims['is_admin']:
@@ -124,9 +142,11 @@ class SalesmanDetail(Resource):
                     auth_token  = { "Authorization": authorization}
                     record_user_log(auth_token, log_method, log_description)
 
-                    return salesman_schema.dump(salesman), 200
+                    return schema.dump(salesman), 200
                 return {'message':'You are not authorised to use this resource!'}, 403
             return {'message': 'There is no such record!'}, 404
+        except InvalidFields as e:
+            return {'message': str(e)}, 400
         except Exception as e:
             print('========================================')
             print('Error description: ', e)
@@ -135,6 +155,7 @@ class SalesmanDetail(Resource):
         
     @classmethod
     @jwt_required
+    @admit('salesman_write')
     @api.doc('Edit credit limits')
     @api.expect(edit_salesman_model)
     def put(cls, id:int):
@@ -170,6 +191,7 @@ class SalesmanDetail(Resource):
 
     @classmethod
     @jwt_required
+    @admit('salesman_write')
     @api.doc('Delete salesman')
     def delete(cls, id:int):
         '''Delete Salesman'''
@@ -202,6 +224,7 @@ class SalesmanDetail(Resource):
 class GetSalesmanUser(Resource):
     @classmethod
     @jwt_required
+    @admit('salesman_read')
     @api.doc('Get salesman by user')
     def get(cls, user_id:int):
         '''Get Salesman by User'''
@@ -210,6 +233,7 @@ class GetSalesmanUser(Resource):
 
         try:
             if authorised_user['id'] == user_id or claims['is_admin']:
+                schema = schema_for(SalesmanSchema, requested_fields())
                 salesman = SalesmanModel.fetch_by_user_id(user_id=user_id)
                 if salesman:
                     # Record this event in user's logs
@@ -219,9 +243,11 @@ class GetSalesmanUser(Resource):
                     auth_token  = { "Authorization": authorization}
                     record_user_log(auth_token, log_method, log_description)
 
-                    return salesman_schema.dump(salesman), 200
+                    return schema.dump(salesman), 200
                 return {'message': 'There is no such salesman'}, 404     
             return {'message': 'You are not authorised to  view this salesman!'}, 403
+        except InvalidFields as e:
+            return {'message': str(e)}, 400
         except Exception as e:
             print('========================================')
             print('Error description: ', e)
@@ -234,6 +260,7 @@ class GetSalesmanUser(Resource):
 @api.param('id', 'The salesman identifier')
 class SuspendSalesman(Resource):
     @jwt_required
+    @admit('salesman_write')
     @api.doc('Suspend salesman')
     def put(self, id):
         '''Suspend Salesman'''
@@ -266,6 +293,7 @@ class SuspendSalesman(Resource):
 @api.param('id', 'The salesman identifier')
 class RestoreSalesman(Resource):
     @jwt_required
+    @admit('salesman_write')
     @api.doc('Restore salesman')
     def put(self, id):
         '''Restore Salesman'''
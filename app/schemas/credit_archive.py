@@ -0,0 +1,8 @@
+from . import ma
+from models.credit_archive import CreditArchiveModel
+
+class CreditArchiveSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model =CreditArchiveModel
+        dump_only = ('id', 'created', 'updated', 'archived',)
+        include_fk = True
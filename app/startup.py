@@ -0,0 +1,53 @@
+# Usage: python startup.py [config_name] [budget_seconds]
+# Run it in a fresh interpreter so the import is cold; exits with 1 over budget.
+import sys
+import time
+
+
+def measure_startup(config_name:str='testing') -> dict:
+    started = time.perf_counter()
+    from factory import create_app
+    from flask_jwt_extended import create_access_token
+    from models import db
+    imported = time.perf_counter()
+
+    app = create_app(config_name)
+    with app.app_context():
+        if app.config['TESTING']:
+            # The testing database starts out empty
+            db.create_all()
+        token = create_access_token(identity={'id': 0, 'privileges': 'Admin'})
+    created = time.perf_counter()
+
+    # An authenticated read goes through JWT, admission control and the database
+    with app.test_client() as client:
+        response = client.get('/api/salesman?fields=id', headers={'Authorization': f'Bearer {token}'})
+    served = time.perf_counter()
+
+    return {
+        'config': config_name,
+        'status_code': response.status_code,
+        'import': imported - started,
+        'create_app': created - imported,
+        'first_request': served - created,
+        'total': served - started,
+        'budget': app.config['STARTUP_BUDGET'],
+    }
+
+
+if __name__ == '__main__':
+    config_name = sys.argv[1] if len(sys.argv) > 1 else 'testing'
+    timings = measure_startup(config_name)
+    if len(sys.argv) > 2:
+        timings['budget'] = float(sys.argv[2])
+
+    for key in ('import', 'create_app', 'first_request', 'total'):
+        print(f'{key:<14} {timings[key]:.3f}s')
+
+    # 404 just means there are no salesmen yet
+    if timings['status_code'] not in (200, 404):
+        print(f"First request failed with status {timings['status_code']}")
+        sys.exit(1)
+    if timings['total'] > timings['budget']:
+        print(f"Startup took {timings['total']:.3f}s, over the {timings['budget']:.3f}s budget")
+        sys.exit(1)
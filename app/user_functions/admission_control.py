@@ -0,0 +1,225 @@
+# Limits hold across every worker process on the node. The slots of a limit are the
+# bytes of one file under ADMISSION_DIR, held with non-blocking open file description
+# locks that the kernel drops when a worker dies, so harakiri or OOM never leak a slot.
+import errno
+import fcntl
+import glob
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+import requests
+from flask import current_app, request
+
+from models import release_connection
+from .profiling import timed_upstream
+
+ADMITTED, REJECTED = 0, 1
+
+# Python only names these from 3.9; the values are Linux's
+F_OFD_GETLK = getattr(fcntl, 'F_OFD_GETLK', 36)
+F_OFD_SETLK = getattr(fcntl, 'F_OFD_SETLK', 37)
+FLOCK = 'hhqqi4x'  # struct flock: l_type, l_whence, l_start, l_len, l_pid
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+class UpstreamUnavailable(Exception):
+    def __init__(self, name:str):
+        super().__init__(f'Upstream service <{name}> is at its concurrency limit or not responding')
+        self.name = name
+
+
+def _open(directory:str, filename:str) -> int:
+    path = os.path.join(directory, filename)
+    try:
+        return os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    except FileNotFoundError:
+        os.makedirs(directory, exist_ok=True)
+        return os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+
+class SlotFile(object):
+    '''This process's handle on a slot file, with the slots its requests hold'''
+    def __init__(self, directory:str, name:str):
+        self.fd = _open(directory, f'{name}.slots')
+        self.held = set()
+        self.lock = threading.Lock()
+
+    def _fcntl(self, command:int, lock_type:int, slot:int) -> tuple:
+        result = fcntl.fcntl(self.fd, command, struct.pack(FLOCK, lock_type, os.SEEK_SET, slot, 1, 0))
+        return struct.unpack(FLOCK, result)
+
+    def try_lock(self, slot:int) -> bool:
+        try:
+            self._fcntl(F_OFD_SETLK, fcntl.F_WRLCK, slot)
+        except OSError as e:
+            if e.errno not in (errno.EACCES, errno.EAGAIN):
+                raise
+            return False
+        self.held.add(slot)
+        return True
+
+    def locked_until(self, slot:int) -> int:
+        '''Return the end of the run of slots locked by the holder of `slot`'''
+        lock_type, _, start, length, _ = self._fcntl(F_OFD_GETLK, fcntl.F_WRLCK, slot)
+        if lock_type == fcntl.F_UNLCK:
+            return slot + 1
+        return start + length
+
+    def unlock(self, slot:int) -> None:
+        self._fcntl(F_OFD_SETLK, fcntl.F_UNLCK, slot)
+        self.held.discard(slot)
+
+
+class Counters(object):
+    '''Admitted/rejected counts of one process, in a file of its own so that no lock is needed'''
+    def __init__(self, directory:str, name:str):
+        fd = _open(directory, f'{name}.{os.getpid()}.stats')
+        try:
+            if os.fstat(fd).st_size < 16:
+                os.ftruncate(fd, 16)
+            self.counts = mmap.mmap(fd, 16)
+        finally:
+            os.close(fd)
+
+    def add(self, counter:int) -> None:
+        struct.pack_into('Q', self.counts, counter * 8, struct.unpack_from('Q', self.counts, counter * 8)[0] + 1)
+
+
+def _for_process(cls:type, directory:str, name:str):
+    # Cached per process: a forked worker must not share its parent's lock descriptions
+    key = (cls, directory, name)
+    with _files_lock:
+        pid, instance = _files.get(key, (None, None))
+        if pid != os.getpid():
+            instance = cls(directory, name)
+            _files[key] = (os.getpid(), instance)
+        return instance
+
+
+def _read_counts(directory:str, name:str) -> tuple:
+    admitted = rejected = 0
+    for path in glob.glob(os.path.join(directory, f'{name}.*.stats')):
+        with open(path, 'rb') as f:
+            counts = struct.unpack('QQ', f.read(16).ljust(16, b'\0'))
+        admitted, rejected = admitted + counts[ADMITTED], rejected + counts[REJECTED]
+    return admitted, rejected
+
+
+class Bulkhead(object):
+    def __init__(self, name:str, limit:int, directory:str, base:int=0, stats_name:str=None):
+        self.name = name
+        self.limit = limit
+        self.directory = directory
+        self.base = base
+        self.stats_name = stats_name or name
+
+    def try_acquire(self) -> int:
+        '''Take a free slot and return it, or None when all slots are taken'''
+        slots = _for_process(SlotFile, self.directory, self.name)
+        counters = _for_process(Counters, self.directory, self.stats_name)
+        end = self.base + self.limit
+        with slots.lock:
+            # Each process starts at its own offset, so the slots it holds form runs
+            # that a full scan skips with one call each
+            offset = os.getpid() % self.limit if self.limit else 0
+            checked = 0
+            while checked < self.limit:
+                slot = self.base + offset
+                if slot in slots.held:
+                    step = 1
+                elif slots.try_lock(slot):
+                    counters.add(ADMITTED)
+                    return slot
+                else:
+                    step = max(1, min(slots.locked_until(slot), end) - slot)
+                checked += step
+                offset = (offset + step) % self.limit
+            counters.add(REJECTED)
+        return None
+
+    def release(self, slot:int) -> None:
+        slots = _for_process(SlotFile, self.directory, self.name)
+        with slots.lock:
+            slots.unlock(slot)
+
+
+def get_bulkhead(name:str) -> Bulkhead:
+    limits = current_app.config['ADMISSION_LIMITS']
+    return Bulkhead(name, limits.get(name, current_app.config['ADMISSION_DEFAULT_LIMIT']), current_app.config['ADMISSION_DIR'])
+
+
+def get_token_bulkhead(token:str) -> Bulkhead:
+    # Tokens are hashed into a fixed number of buckets, each a range of one slot file
+    limit = current_app.config['ADMISSION_TOKEN_LIMIT']
+    bucket = int(hashlib.sha1(token.encode()).hexdigest()[:8], 16) % current_app.config['ADMISSION_TOKEN_BUCKETS']
+    return Bulkhead('tokens', limit, current_app.config['ADMISSION_DIR'], base=bucket * limit)
+
+
+def busy_response(message:str):
+    retry_after = str(current_app.config['ADMISSION_RETRY_AFTER'])
+    return {'message': message}, 503, {'Retry-After': retry_after}
+
+
+def admit(group:str):
+    '''Reject the request with a 503 when its endpoint group or token is at its limit'''
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            token_bulkhead = get_token_bulkhead(request.headers.get('Authorization', ''))
+            token_slot = token_bulkhead.try_acquire()
+            if token_slot is None:
+                return busy_response('Too many concurrent requests for this token. Please retry later.')
+            try:
+                bulkhead = get_bulkhead(group)
+                slot = bulkhead.try_acquire()
+                if slot is None:
+                    return busy_response('The service is busy. Please retry later.')
+                try:
+                    return fn(*args, **kwargs)
+                except UpstreamUnavailable as e:
+                    return busy_response(f'The {e.name} service is busy. Please retry later.')
+                finally:
+                    bulkhead.release(slot)
+            finally:
+                token_bulkhead.release(token_slot)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def upstream(name:str):
+    '''Hold a slot for an upstream service for the duration of a call'''
+    bulkhead = get_bulkhead(name)
+    slot = bulkhead.try_acquire()
+    if slot is None:
+        raise UpstreamUnavailable(name)
+    # Don't hold a pooled DB connection while waiting on the network
+    release_connection()
+    try:
+        with timed_upstream(name):
+            yield bulkhead
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+        # Calls pass UPSTREAM_TIMEOUT, so a hung service fails fast instead of holding the slot
+        raise UpstreamUnavailable(name)
+    finally:
+        bulkhead.release(slot)
+
+
+def admission_stats() -> dict:
+    directory = current_app.config['ADMISSION_DIR']
+    stats = {}
+    for name in sorted(current_app.config['ADMISSION_LIMITS']):
+        admitted, rejected = _read_counts(directory, name)
+        stats[name] = {'limit': current_app.config['ADMISSION_LIMITS'][name], 'admitted': admitted, 'rejected': rejected}
+    admitted, rejected = _read_counts(directory, 'tokens')
+    return {
+        'bulkheads': stats,
+        'tokens': {'limit': current_app.config['ADMISSION_TOKEN_LIMIT'], 'admitted': admitted, 'rejected': rejected},
+    }
@@ -0,0 +1,54 @@
+from flask import current_app
+
+from models import db
+from models.credit import CreditModel
+from models.credit_archive import CreditArchiveModel
+from .credit_functions import fetch_prices
+
+
+def archive_settled_credits(auth_token, batch_size:int=None, after_id:int=0, max_batches:int=None) -> dict:
+    '''Archive settled credits with an id above after_id, stopping after max_batches batches if given'''
+    batch_size = batch_size or current_app.config['CREDIT_ARCHIVE_BATCH_SIZE']
+    summary = {'scanned': 0, 'archived': 0, 'unresolved': 0, 'batches': 0, 'next_after_id': None}
+
+    last_id = after_id
+    while max_batches is None or summary['batches'] < max_batches:
+        credits = CreditModel.fetch_batch(last_id, batch_size)
+        if not credits:
+            return summary
+        last_id = credits[-1].id
+        summary['scanned'] += len(credits)
+        summary['batches'] += 1
+
+        licenses = fetch_prices(
+            auth_token,
+            [credit.license_id for credit in credits],
+            max_workers=current_app.config['CREDIT_CHECK_MAX_WORKERS']
+        )
+        settled = []
+        for credit in credits:
+            license_key = licenses[credit.license_id]
+            if 'license_key' not in license_key.keys():
+                # Leave it active until the license service can tell us its status
+                summary['unresolved'] += 1
+            elif license_key['license_status'] == 'sold':
+                settled.append(credit)
+        if not settled:
+            continue
+
+        CreditArchiveModel.ensure_partitions([credit.created for credit in settled])
+        for credit in settled:
+            db.session.add(CreditArchiveModel(
+                id=credit.id,
+                created=credit.created,
+                salesman_id=credit.salesman_id,
+                license_id=credit.license_id,
+                updated=credit.updated
+            ))
+        CreditModel.query.filter(CreditModel.id.in_([credit.id for credit in settled])).delete(synchronize_session=False)
+        db.session.commit()
+        summary['archived'] += len(settled)
+
+    # Stopped at max_batches, so there may be more credits after this one
+    summary['next_after_id'] = last_id
+    return summary
@@ -1,9 +1,18 @@
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g
+
+from models import release_connection
+
+from .admission_control import upstream
+from .profiling import current_profile
 
 def license_existence(auth_token, license_id):
-    license_url = f'http://172.18.0.1:3101/api/license/{license_id}'
-    req = requests.get(license_url, headers=auth_token)
+    license_url = f"{current_app.config['LICENSE_SERVICE_URL']}/api/license/{license_id}"
+    with upstream('license_service'):
+        req = requests.get(license_url, headers=auth_token, timeout=current_app.config['UPSTREAM_TIMEOUT'])
     
     if req.status_code != 200:    
         resp = req.json()
@@ -18,11 +27,47 @@ def license_existence(auth_token, license_id):
     return license_key
 
 def price_fetcher(auth_token, license_id):
-    license_url = f'http://172.18.0.1:3101/api/license/{license_id}'
-    req = requests.get(license_url, headers=auth_token)
+    license_url = f"{current_app.config['LICENSE_SERVICE_URL']}/api/license/{license_id}"
+    with upstream('license_service'):
+        req = requests.get(license_url, headers=auth_token, timeout=current_app.config['UPSTREAM_TIMEOUT'])
 
     if req.status_code != 200:    
         resp = req.json()
         return {'message':resp, 'status_code': req.status_code}
 
     return req.json()
+
+def fetch_prices(auth_token, license_ids, max_workers=4):
+    '''Fetch several licenses at once, returning a dict of license_id to price_fetcher response'''
+    license_ids = list(set(license_ids))
+    if not license_ids:
+        return {}
+    app = current_app._get_current_object()
+    profile = current_profile()
+    release_connection()
+
+    def fetch(license_id):
+        with app.app_context():
+            # Calls made from the pool still belong to the request's profile
+            g.profile = profile
+            return price_fetcher(auth_token, license_id)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(license_ids))) as executor:
+        return dict(zip(license_ids, executor.map(fetch, license_ids)))
+
+def credit_exposure(credits, licenses):
+    '''
+    Sum the prices of the credited licenses that are still on credit, given the
+    fetch_prices responses for them. Returns None if any license could not be fetched.
+    '''
+    exposure = 0.0
+    for credit in credits:
+        license_key = licenses[credit.license_id]
+        if 'license_key' not in license_key.keys():
+            return None
+        if license_key['license_status'] == 'on_credit':
+            exposure += float(license_key['price'])
+    return exposure
+
+def exceeds_limit(exposure, price, limit):
+    return exposure + price > limit
@@ -0,0 +1,75 @@
+from functools import lru_cache
+
+from flask import request
+from marshmallow import Schema
+from marshmallow.fields import Nested
+
+
+class InvalidFields(Exception):
+    pass
+
+
+def requested_fields() -> tuple:
+    '''Return the fields asked for in the query string, or None for all fields'''
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return tuple(sorted({field.strip() for field in fields.split(',') if field.strip()})) or None
+
+
+@lru_cache(maxsize=32)
+def _full_schema(schema_cls:type) -> Schema:
+    return schema_cls()
+
+
+def _check_fields(schema:Schema, only:tuple) -> None:
+    '''Check every path, including nested ones, which marshmallow only checks when dumping'''
+    for path in only:
+        name, _, rest = path.partition('.')
+        field = schema.fields.get(name)
+        if field is None:
+            raise InvalidFields(f'Invalid fields for {type(schema).__name__}: {path}')
+        if rest:
+            if not isinstance(field, Nested):
+                raise InvalidFields(f'Field {name} of {type(schema).__name__} has no nested fields: {path}')
+            _check_fields(field.schema, (rest,))
+
+
+@lru_cache(maxsize=128)
+def _build_schema(schema_cls:type, only:tuple, many:bool) -> Schema:
+    return schema_cls(only=only, many=many)
+
+
+def schema_for(schema_cls:type, only:tuple=None, many:bool=False) -> Schema:
+    '''Return a cached schema instance restricted to the given fields'''
+    if only:
+        _check_fields(_full_schema(schema_cls), only)
+    try:
+        return _build_schema(schema_cls, only, many)
+    except ValueError as e:
+        # marshmallow raises ValueError for field names the schema doesn't have
+        raise InvalidFields(str(e))
+
+
+def load_columns(model:type, only:tuple=None) -> tuple:
+    '''Return the model's column names needed to serialise the given fields'''
+    if not only:
+        return None
+    column_names = {column.key for column in model.__table__.columns}
+    columns = {field.split('.')[0] for field in only} & column_names
+    # Hyperlinks and relationships are built from the primary key
+    columns.add('id')
+    return tuple(sorted(columns))
+
+
+def nested_load_columns(model:type, only:tuple, name:str) -> tuple:
+    '''
+    Return the columns of the nested field `name` to load, or None when the nested
+    field isn't selected. An empty tuple means every column.
+    '''
+    if not only or name in only:
+        return ()
+    nested = tuple(path.split('.', 1)[1] for path in only if path.startswith(name + '.'))
+    if not nested:
+        return None
+    return load_columns(model, nested)
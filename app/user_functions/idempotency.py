@@ -0,0 +1,144 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+
+from models import db, committed_writes
+from models.idempotency import IdempotencyKeyModel
+
+
+def _split_response(result):
+    '''Split a resource return value into body, status code and headers'''
+    if isinstance(result, tuple):
+        body = result[0]
+        status_code = result[1] if len(result) > 1 else 200
+        headers = result[2] if len(result) > 2 else {}
+        return body, status_code, headers
+    return result, 200, {}
+
+
+def _replay(record:IdempotencyKeyModel):
+    return json.loads(record.response_body), record.response_code, {'Idempotent-Replayed': 'true'}
+
+
+def _lease_end() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=current_app.config['IDEMPOTENCY_LEASE'])
+
+
+class LeaseRenewer(object):
+    '''Keeps extending the lease on a key while its request runs, so a duplicate never takes over a live request'''
+    def __init__(self, app, key:str):
+        self.app = app
+        self.key = key
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self) -> None:
+        with self.app.app_context():
+            while not self.stopped.wait(self.app.config['IDEMPOTENCY_LEASE'] / 3):
+                try:
+                    IdempotencyKeyModel.renew(self.key, _lease_end())
+                except Exception as e:
+                    db.session.rollback()
+                    print('Error: could not renew the lease on an idempotency key', e)
+            db.session.remove()
+
+
+def _claim(key:str, request_hash:str) -> IdempotencyKeyModel:
+    '''Record the key as in progress, or return the existing record if another request holds it'''
+    expires = datetime.utcnow() + timedelta(seconds=current_app.config['IDEMPOTENCY_TTL'])
+    try:
+        IdempotencyKeyModel(key=key, request_hash=request_hash, locked_until=_lease_end(), expires=expires).insert_record()
+        return None
+    except IntegrityError:
+        db.session.rollback()
+    return IdempotencyKeyModel.fetch_by_key(key)
+
+
+def _wait_for(key:str) -> IdempotencyKeyModel:
+    '''Poll until the request holding the key completes, releases it or loses its lease, or the wait times out'''
+    deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_TIMEOUT']
+    while time.monotonic() < deadline:
+        time.sleep(current_app.config['IDEMPOTENCY_POLL_INTERVAL'])
+        # End the current transaction so the next read sees the other request's commit
+        db.session.rollback()
+        record = IdempotencyKeyModel.fetch_by_key(key)
+        if record is None or record.status == 'completed' or record.locked_until < datetime.utcnow():
+            return record
+    return IdempotencyKeyModel.fetch_by_key(key)
+
+
+def idempotent(fn):
+    '''Make a POST handler safe to retry with an Idempotency-Key header'''
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return fn(*args, **kwargs)
+        if len(idempotency_key) > 128:
+            return {'message': 'The Idempotency-Key header must be at most 128 characters long.'}, 400
+
+        authorised_user = get_jwt_identity()
+        key = f"{authorised_user['id']}:{request.path}:{idempotency_key}"
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+
+        IdempotencyKeyModel.delete_expired()
+        record = _claim(key, request_hash)
+        while record is not None:
+            if record.request_hash != request_hash:
+                return {'message': 'This Idempotency-Key has already been used with a different request.'}, 422
+            if record.status == 'completed':
+                return _replay(record)
+            if record.locked_until < datetime.utcnow():
+                # The request holding the key died before finishing, so take it over
+                if IdempotencyKeyModel.take_over(key, _lease_end()):
+                    break
+                record = IdempotencyKeyModel.fetch_by_key(key)
+            else:
+                record = _wait_for(key)
+                if record is not None and record.status != 'completed' and record.locked_until >= datetime.utcnow():
+                    retry_after = str(current_app.config['ADMISSION_RETRY_AFTER'])
+                    return {'message': 'A request with this Idempotency-Key is still in progress.'}, 409, {'Retry-After': retry_after}
+            if record is None:
+                # The first request failed and released the key, so this one takes over
+                record = _claim(key, request_hash)
+
+        # Writes the handler committed mean a retry must not run it again, even after a 5xx
+        writes_before = committed_writes()
+        renewer = LeaseRenewer(current_app._get_current_object(), key)
+        renewer.start()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            renewer.stop()
+            db.session.rollback()
+            if committed_writes() > writes_before:
+                body = {'message': 'The request failed after it was partly applied.'}
+                IdempotencyKeyModel.complete(key, 500, json.dumps(body))
+            else:
+                IdempotencyKeyModel.delete_by_key(key)
+            raise
+        renewer.stop()
+
+        body, status_code, headers = _split_response(result)
+        if status_code >= 500 and committed_writes() == writes_before:
+            # Nothing was changed, so the request is safe to run again on retry
+            db.session.rollback()
+            IdempotencyKeyModel.delete_by_key(key)
+        else:
+            IdempotencyKeyModel.complete(key, status_code, json.dumps(body))
+        return result
+    return wrapper
@@ -0,0 +1,25 @@
+from flask import request
+
+
+class InvalidPage(Exception):
+    pass
+
+
+def _int_arg(name:str, default:int, minimum:int) -> int:
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise InvalidPage(f'{name} must be a whole number')
+    if value < minimum:
+        raise InvalidPage(f'{name} must be at least {minimum}')
+    return value
+
+
+def page_args(max_limit:int) -> tuple:
+    '''Return (after_id, limit) from the query string; clients pass the last id they got as after_id'''
+    after_id = _int_arg('after_id', 0, 0)
+    limit = min(_int_arg('limit', max_limit, 1), max_limit)
+    return after_id, limit
@@ -0,0 +1,221 @@
+# Profiles are JSON files in PROFILE_DIR so that every worker process can serve them
+import glob
+import importlib
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, g, request, has_app_context
+from flask_jwt_extended import verify_jwt_in_request_optional, get_jwt_claims
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def _original(module:str, name:str):
+    '''Return the unpatched version of a function when gevent has monkey patched it'''
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched(module):
+            return monkey.get_original(module, name)
+    except ImportError:
+        pass
+    return getattr(importlib.import_module(module), name)
+
+
+_start_new_thread = _original('_thread', 'start_new_thread')
+_get_ident = _original('_thread', 'get_ident')
+_sleep = _original('time', 'sleep')
+
+try:
+    from greenlet import getcurrent as _current_greenlet
+except ImportError:
+    _current_greenlet = None
+
+
+# The sampler runs in a real OS thread even under gevent, and follows the
+# request's greenlet rather than whatever the thread is running
+class StackSampler(object):
+    '''Counts the call stacks of one thread or greenlet, in the folded format flamegraph tools read'''
+    def __init__(self, interval:float):
+        self.interval = interval
+        self.target = _get_ident()
+        self.greenlet = _current_greenlet() if _current_greenlet else None
+        self.stacks = {}
+        self.running = False
+
+    def start(self) -> None:
+        self.running = True
+        _start_new_thread(self._run, ())
+
+    def stop(self) -> None:
+        self.running = False
+
+    def _frame(self):
+        # A greenlet only has gr_frame while it is switched out; while it runs,
+        # its stack is the OS thread's
+        if self.greenlet is not None and self.greenlet.gr_frame is not None:
+            return self.greenlet.gr_frame
+        return sys._current_frames().get(self.target)
+
+    def _run(self) -> None:
+        while self.running:
+            _sleep(self.interval)
+            frame = self._frame()
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                folded = ';'.join(reversed(stack))
+                self.stacks[folded] = self.stacks.get(folded, 0) + 1
+
+
+def current_profile() -> dict:
+    if not has_app_context():
+        return None
+    return g.get('profile')
+
+
+@contextmanager
+def timed_upstream(name:str):
+    '''Record how long an upstream call took in the current profile, if there is one'''
+    profile = current_profile()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile['upstream'].append({'name': name, 'duration': time.perf_counter() - started})
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile() is not None:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    started = conn.info.get('profile_started')
+    if profile is not None and started:
+        profile['sql'].append({'statement': statement, 'duration': time.perf_counter() - started.pop()})
+
+
+def _trigger() -> str:
+    '''Return why this request should be profiled, or None'''
+    if request.headers.get('X-Profile') or request.args.get('profile'):
+        try:
+            verify_jwt_in_request_optional()
+            if get_jwt_claims().get('is_admin'):
+                return 'admin'
+        except Exception:
+            # Let the resource report the bad token; just don't profile
+            pass
+    sample_rate = current_app.config['PROFILE_SAMPLE_RATE']
+    if sample_rate and random.random() < sample_rate:
+        return 'sampled'
+    return None
+
+
+def start_profile() -> None:
+    trigger = _trigger()
+    if not trigger:
+        return
+    g.profile = {
+        'id': uuid.uuid4().hex,
+        'started': datetime.utcnow().isoformat(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'trigger': trigger,
+        'interval': current_app.config['PROFILE_INTERVAL'],
+        'sql': [],
+        'upstream': [],
+    }
+    g.profile_started = time.perf_counter()
+    g.profile_sampler = StackSampler(current_app.config['PROFILE_INTERVAL'])
+    g.profile_sampler.start()
+
+
+def finish_profile(response):
+    profile = current_profile()
+    if profile is None:
+        return response
+    g.profile_sampler.stop()
+    g.profile = None
+
+    profile['status_code'] = response.status_code
+    profile['duration'] = time.perf_counter() - g.profile_started
+    profile['sql_time'] = sum(statement['duration'] for statement in profile['sql'])
+    profile['upstream_time'] = sum(call['duration'] for call in profile['upstream'])
+    profile['samples'] = dict(g.profile_sampler.stacks)
+    try:
+        save_profile(profile)
+        response.headers['X-Profile-Id'] = profile['id']
+    except OSError as e:
+        print('Error: could not save profile', e)
+    return response
+
+
+def stop_sampler(exc=None) -> None:
+    sampler = g.get('profile_sampler')
+    if sampler is not None:
+        sampler.stop()
+
+
+def init_profiling(app) -> None:
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(stop_sampler)
+
+
+def _profile_paths() -> list:
+    return sorted(glob.glob(os.path.join(current_app.config['PROFILE_DIR'], '*.json')))
+
+
+def save_profile(profile:dict) -> None:
+    directory = current_app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{time.time_ns()}-{profile['id']}.json")
+    with open(path, 'w') as f:
+        json.dump(profile, f)
+
+    for old_path in _profile_paths()[:-current_app.config['PROFILE_STORE_SIZE']]:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+
+def fetch_profiles() -> list:
+    '''Return summaries of the stored profiles, newest first'''
+    profiles = []
+    for path in reversed(_profile_paths()):
+        try:
+            with open(path) as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            continue
+        profiles.append({key: profile[key] for key in (
+            'id', 'started', 'method', 'path', 'trigger', 'status_code', 'duration', 'sql_time', 'upstream_time'
+        )})
+    return profiles
+
+
+def fetch_profile(profile_id:str) -> dict:
+    paths = glob.glob(os.path.join(current_app.config['PROFILE_DIR'], f'*-{profile_id}.json'))
+    if not paths:
+        return None
+    with open(paths[0]) as f:
+        return json.load(f)
+
+
+def folded_stacks(profile:dict) -> str:
+    '''Render the samples in the folded format read by flamegraph.pl and speedscope'''
+    return '\n'.join(f'{stack} {count}' for stack, count in sorted(profile['samples'].items())) + '\n'
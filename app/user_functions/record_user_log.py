@@ -1,9 +1,18 @@
 import requests
-log_submission_url = 'http://172.18.0.1:3100/api/logs' # 'http://0.0.0.0:3100/api/logs' # 172.18.0.3
+from flask import current_app
+
+from .admission_control import upstream, UpstreamUnavailable
 
 def record_user_log(auth_token, method, description):
+    log_submission_url = f"{current_app.config['USER_SERVICE_URL']}/api/logs"
     payload = {'method': method, 'description': description}
-    res = requests.post(log_submission_url, json=payload, headers=auth_token)
+    try:
+        with upstream('log_service'):
+            res = requests.post(log_submission_url, json=payload, headers=auth_token, timeout=current_app.config['UPSTREAM_TIMEOUT'])
+    except UpstreamUnavailable as e:
+        # Logging is best effort, so shed it rather than hold up the request
+        print('Error:', e)
+        return {'Message': description + ', but log was never recorded in database.'}, 503
     if res.status_code != 201:
         print ("Error:", res.status_code)
         print(res.text)
@@ -0,0 +1,117 @@
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, APP_DIR)
+
+import pytest
+import requests
+from flask_jwt_extended import create_access_token
+
+from factory import create_app
+from models import db
+from models.credit import CreditModel
+from models.salesman import SalesmanModel
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeUpstream(object):
+    '''Stands in for the user/log service and the license service'''
+    def __init__(self, config):
+        self.license_url = config['LICENSE_SERVICE_URL']
+        self.user_url = config['USER_SERVICE_URL']
+        self.licenses = {}
+        self.users = set()
+        self.logs = []
+        self.calls = []
+        self.credit_put_status = 200
+        self.error = None
+
+    def add_license(self, license_id, price, status='available'):
+        self.licenses[license_id] = {'license_key': f'KEY-{license_id}', 'license_status': status, 'price': price}
+
+    def __call__(self, method, url, **kwargs):
+        method = method.upper()
+        self.calls.append((method, url, kwargs))
+        if self.error:
+            raise self.error
+        if url.startswith(self.user_url):
+            path = url[len(self.user_url):]
+            if method == 'POST' and path == '/api/logs':
+                self.logs.append(kwargs['json'])
+                return FakeResponse(201, {})
+            if method == 'GET' and path.startswith('/api/user/'):
+                if int(path.rsplit('/', 1)[1]) in self.users:
+                    return FakeResponse(200, {})
+                return FakeResponse(404, {'message': 'User not found'})
+        if url.startswith(self.license_url):
+            path = url[len(self.license_url):]
+            license_id = int(path.rsplit('/', 1)[1])
+            if method == 'GET' and path.startswith('/api/license/'):
+                if license_id in self.licenses:
+                    return FakeResponse(200, dict(self.licenses[license_id]))
+                return FakeResponse(404, {'message': 'License not found'})
+            if method == 'PUT' and path.startswith('/api/license/credit/'):
+                if self.credit_put_status == 200:
+                    self.licenses[license_id]['license_status'] = 'on_credit'
+                return FakeResponse(self.credit_put_status, {'message': 'license service'})
+        raise AssertionError(f'Unexpected upstream call {method} {url}')
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        ADMISSION_DIR=str(tmp_path / 'admission'),
+        PROFILE_DIR=str(tmp_path / 'profiles'),
+    )
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def upstream(app, monkeypatch):
+    fake = FakeUpstream(app.config)
+    monkeypatch.setattr(requests.api, 'request', fake)
+    return fake
+
+
+def auth_headers(user_id, privileges):
+    token = create_access_token(identity={'id': user_id, 'privileges': privileges})
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def admin_headers(app):
+    return auth_headers(1, 'Admin')
+
+
+@pytest.fixture
+def user_headers(app):
+    return auth_headers(2, 'Salesman')
+
+
+def add_salesman(user_id, limit, license_ids=()):
+    salesman = SalesmanModel(user_id=user_id, limit=limit)
+    salesman.insert_record()
+    for license_id in license_ids:
+        CreditModel(salesman_id=salesman.id, license_id=license_id).insert_record()
+    return salesman.id
@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy import event, inspect
+
+from models import db, release_connection
+from models.credit import CreditModel
+from models.salesman import SalesmanModel
+from test.conftest import add_salesman
+
+
+@pytest.fixture
+def transactions(app):
+    '''Record every commit and rollback sent to the database'''
+    ended = []
+    commit = lambda conn: ended.append('commit')
+    rollback = lambda conn: ended.append('rollback')
+    event.listen(db.engine, 'commit', commit)
+    event.listen(db.engine, 'rollback', rollback)
+    yield ended
+    event.remove(db.engine, 'commit', commit)
+    event.remove(db.engine, 'rollback', rollback)
+
+
+def test_does_nothing_in_sync_mode(app, transactions):
+    salesman_id = add_salesman(10, 100.0)
+    transactions.clear()
+    SalesmanModel.fetch_by_id(salesman_id)
+
+    release_connection()
+
+    assert transactions == []
+
+
+def test_ends_read_only_transaction_in_gevent_mode(app, transactions):
+    app.config['COOPERATIVE_WORKERS'] = True
+    salesman_id = add_salesman(10, 100.0)
+    transactions.clear()
+    salesman = SalesmanModel.fetch_by_id(salesman_id)
+
+    release_connection()
+
+    assert transactions == ['commit']
+    # Loaded objects stay usable without being reloaded
+    assert not inspect(salesman).expired_attributes
+
+
+def test_check_runs_no_extra_queries_in_gevent_mode(app, client, admin_headers, upstream):
+    salesman_id = add_salesman(10, 10000.0, range(1, 21))
+    for license_id in range(1, 23):
+        upstream.add_license(license_id, 10, 'on_credit' if license_id <= 20 else 'available')
+    items = [{'salesman_id': salesman_id, 'license_id': 21}, {'salesman_id': salesman_id, 'license_id': 22}]
+
+    def statements_for_check():
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            assert client.post('/api/credit/check', json={'items': items}, headers=admin_headers).status_code == 200
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return statements
+
+    sync_statements = statements_for_check()
+    app.config['COOPERATIVE_WORKERS'] = True
+    assert statements_for_check() == sync_statements
+    assert len(sync_statements) <= 4
+
+
+def test_keeps_transaction_with_flushed_writes(app, transactions):
+    app.config['COOPERATIVE_WORKERS'] = True
+    salesman_id = add_salesman(10, 100.0)
+    transactions.clear()
+    db.session.add(CreditModel(salesman_id=salesman_id, license_id=1))
+    # The query autoflushes the new credit, so the session has no pending objects left
+    assert len(CreditModel.fetch_all()) == 1
+    assert not db.session.new
+
+    release_connection()
+    db.session.commit()
+
+    assert transactions == ['commit']
+    assert len(CreditModel.fetch_all()) == 1
+
+
+def test_keeps_transaction_with_pending_writes(app, transactions):
+    app.config['COOPERATIVE_WORKERS'] = True
+    salesman = SalesmanModel.fetch_by_id(add_salesman(10, 100.0))
+    transactions.clear()
+    salesman.limit = 200.0
+
+    release_connection()
+    db.session.commit()
+
+    assert transactions == ['commit']
+    assert SalesmanModel.fetch_by_id(salesman.id).limit == 200.0
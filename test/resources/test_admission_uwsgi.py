@@ -0,0 +1,80 @@
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from models import db
+from test.conftest import APP_DIR, add_salesman
+
+UWSGI = shutil.which('uwsgi') or shutil.which('uwsgi', path=os.path.dirname(sys.executable))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class SlowLogService(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(1)
+        self.send_response(201)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.skipif(UWSGI is None, reason='uwsgi is not installed')
+def test_group_limit_holds_across_sync_uwsgi_workers(app, admin_headers, tmp_path):
+    # Sync uwsgi: one request per process, so only a node-wide limit can shed load
+    add_salesman(10, 500.0, [1])
+    db.session.remove()
+
+    log_service = ThreadingHTTPServer(('127.0.0.1', free_port()), SlowLogService)
+    threading.Thread(target=log_service.serve_forever, daemon=True).start()
+    port = free_port()
+    env = dict(os.environ,
+        APP_CONFIG='testing',
+        TEST_DATABASE_URI=app.config['SQLALCHEMY_DATABASE_URI'],
+        USER_SERVICE_URL=f'http://127.0.0.1:{log_service.server_address[1]}',
+        ADMISSION_DIR=str(tmp_path / 'uwsgi_admission'),
+        ADMISSION_CREDIT_READ_LIMIT='2',
+    )
+    server = subprocess.Popen(
+        [UWSGI, '--http', f'127.0.0.1:{port}', '--master', '--processes', '4', '--chdir', APP_DIR,
+         '--module', 'main', '--callable', 'app', '--disable-logging', '--die-on-term'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f'http://127.0.0.1:{port}/api/credit/1'
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(f'http://127.0.0.1:{port}/api/swagger.json', timeout=1)
+                break
+            except requests.ConnectionError:
+                assert time.monotonic() < deadline, 'uwsgi did not start'
+                time.sleep(0.2)
+
+        with ThreadPoolExecutor(4) as pool:
+            responses = list(pool.map(lambda _: requests.get(url, headers=admin_headers, timeout=10), range(4)))
+    finally:
+        server.terminate()
+        server.wait()
+        log_service.shutdown()
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [200, 200, 503, 503]
+    assert all('Retry-After' in response.headers for response in responses if response.status_code == 503)
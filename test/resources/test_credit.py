@@ -0,0 +1,127 @@
+from models.credit import CreditModel
+from test.conftest import add_salesman
+
+
+def test_check_reports_headroom_without_writing(client, admin_headers, upstream):
+    salesman_id = add_salesman(10, 100.0, [1, 2])
+    upstream.add_license(1, 30, 'on_credit')
+    upstream.add_license(2, 50, 'sold')  # settled, so not part of the exposure
+    upstream.add_license(3, 40)
+    upstream.add_license(4, 40)
+    upstream.add_license(5, 20)
+    upstream.add_license(6, 10)
+    upstream.add_license(7, 10, 'on_credit')
+
+    items = [
+        {'salesman_id': salesman_id, 'license_id': 3},
+        {'salesman_id': salesman_id, 'license_id': 4},
+        {'salesman_id': salesman_id, 'license_id': 5},
+        {'salesman_id': 99, 'license_id': 6},
+        {'salesman_id': salesman_id, 'license_id': 1},
+        {'salesman_id': salesman_id, 'license_id': 7},
+        {'salesman_id': salesman_id, 'license_id': 8},
+        {'salesman_id': salesman_id, 'license_id': 3},
+    ]
+    res = client.post('/api/credit/check', json={'items': items}, headers=admin_headers)
+
+    assert res.status_code == 200
+    body = res.get_json()
+    assert [item['accepted'] for item in body['items']] == [True, False, True, False, False, False, False, False]
+    assert body['items'][1]['message'] == 'Adding this item will exceed the salesman limits.'
+    assert body['items'][3]['message'] == 'The specified salesman does not exist'
+    assert body['items'][4]['message'] == 'This license has already been credited.'
+    assert body['items'][7]['message'] == 'This license has already been credited.'
+    assert body['salesmen'] == [{
+        'salesman_id': salesman_id,
+        'limit': 100.0,
+        'exposure': 30.0,
+        'headroom': 70.0,
+        'headroom_after_accepted': 10.0,
+    }]
+
+    # Each license was looked up once and nothing was written
+    license_gets = [url for method, url, _ in upstream.calls if method == 'GET' and '/api/license/' in url]
+    assert sorted(license_gets) == sorted(set(license_gets))
+    assert not [call for call in upstream.calls if call[0] == 'PUT']
+    assert len(CreditModel.fetch_all()) == 2
+
+
+def test_post_and_check_agree_for_salesman_without_credits(client, admin_headers, upstream):
+    salesman_id = add_salesman(10, 50.0)
+    upstream.add_license(3, 80)
+    upstream.add_license(4, 40)
+
+    check = client.post('/api/credit/check', headers=admin_headers, json={'items': [
+        {'salesman_id': salesman_id, 'license_id': 3},
+    ]}).get_json()
+    assert check['items'][0]['accepted'] is False
+
+    res = client.post('/api/credit', json={'salesman_id': salesman_id, 'license_id': 3}, headers=admin_headers)
+    assert res.status_code == 400
+    assert CreditModel.fetch_all() == []
+
+    res = client.post('/api/credit', json={'salesman_id': salesman_id, 'license_id': 4}, headers=admin_headers)
+    assert res.status_code == 201
+    assert res.get_json()['license_id'] == 4
+
+
+def test_post_counts_existing_credits(client, admin_headers, upstream):
+    salesman_id = add_salesman(10, 100.0, [1])
+    upstream.add_license(1, 70, 'on_credit')
+    upstream.add_license(2, 40)
+
+    res = client.post('/api/credit', json={'salesman_id': salesman_id, 'license_id': 2}, headers=admin_headers)
+
+    assert res.status_code == 400
+    assert 'exceed' in res.get_json()['message']
+
+
+def test_archive_endpoint_runs_one_batch(app, client, admin_headers, upstream):
+    add_salesman(10, 1000.0, [1, 2, 3])
+    for license_id in (1, 2, 3):
+        upstream.add_license(license_id, 10, 'sold')
+
+    res = client.post('/api/credit/archive?limit=2', headers=admin_headers)
+    assert res.status_code == 200
+    summary = res.get_json()
+    assert (summary['scanned'], summary['archived'], summary['batches']) == (2, 2, 1)
+
+    res = client.post(f"/api/credit/archive?after_id={summary['next_after_id']}", headers=admin_headers)
+    assert res.get_json()['archived'] == 1
+    assert CreditModel.fetch_all() == []
+
+
+def test_archive_listing_is_paginated(app, client, admin_headers, user_headers, upstream):
+    salesman_id = add_salesman(2, 1000.0, [1, 2, 3])
+    add_salesman(11, 1000.0, [4])
+    for license_id in (1, 2, 3, 4):
+        upstream.add_license(license_id, 10, 'sold')
+    client.post('/api/credit/archive', headers=admin_headers)
+    app.config['CREDIT_ARCHIVE_PAGE_SIZE'] = 3
+
+    first = client.get('/api/credit/archive?limit=2', headers=admin_headers).get_json()
+    rest = client.get(f"/api/credit/archive?after_id={first[-1]['id']}", headers=admin_headers).get_json()
+    assert [credit['license_id'] for credit in first] == [1, 2]
+    assert [credit['license_id'] for credit in rest] == [3, 4]
+    assert len(client.get('/api/credit/archive?limit=50', headers=admin_headers).get_json()) == 3
+
+    own = client.get(f'/api/credit/archive/salesman/{salesman_id}?after_id=1&limit=1', headers=user_headers)
+    assert [credit['license_id'] for credit in own.get_json()] == [2]
+
+    assert client.get('/api/credit/archive?limit=0', headers=admin_headers).status_code == 400
+    assert client.get('/api/credit/archive?after_id=x', headers=admin_headers).status_code == 400
+
+
+def test_credits_by_salesman_with_fields(client, admin_headers, user_headers, upstream):
+    salesman_id = add_salesman(2, 100.0, [1, 2])
+    other_id = add_salesman(11, 100.0, [3])
+
+    res = client.get(f'/api/credit/salesman/{salesman_id}?fields=license_id', headers=admin_headers)
+    assert res.status_code == 200
+    assert res.get_json() == [{'license_id': 1}, {'license_id': 2}]
+
+    own = client.get(f'/api/credit/salesman/{salesman_id}?fields=license_id', headers=user_headers)
+    assert own.status_code == 200
+    assert client.get(f'/api/credit/salesman/{other_id}', headers=user_headers).status_code == 403
+    assert client.get(f'/api/credit/salesman/{salesman_id}?fields=bogus', headers=admin_headers).status_code == 400
+    assert client.get('/api/credit/salesman/99', headers=admin_headers).status_code == 404
@@ -0,0 +1,56 @@
+import time
+
+import greenlet
+
+from user_functions.profiling import StackSampler
+from test.conftest import add_salesman
+
+
+def test_admin_can_profile_a_request(app, client, admin_headers, upstream):
+    add_salesman(10, 100.0)
+
+    res = client.get('/api/salesman', headers={**admin_headers, 'X-Profile': '1'})
+    profile_id = res.headers['X-Profile-Id']
+
+    profiles = client.get('/api/debug/profiles', headers=admin_headers).get_json()
+    assert [(profile['id'], profile['trigger'], profile['path']) for profile in profiles] == [(profile_id, 'admin', '/api/salesman')]
+
+    profile = client.get(f'/api/debug/profiles/{profile_id}', headers=admin_headers).get_json()
+    assert profile['status_code'] == 200
+    assert any('salesmen' in statement['statement'] for statement in profile['sql'])
+    assert [call['name'] for call in profile['upstream']] == ['log_service']
+
+    folded = client.get(f'/api/debug/profiles/{profile_id}?format=folded', headers=admin_headers)
+    assert folded.content_type.startswith('text/plain')
+
+
+def test_only_admins_can_profile(app, client, user_headers, upstream):
+    add_salesman(2, 100.0)
+
+    res = client.get('/api/salesman/user/2', headers={**user_headers, 'X-Profile': '1'})
+    assert res.status_code == 200
+    assert 'X-Profile-Id' not in res.headers
+    assert client.get('/api/debug/profiles', headers=user_headers).status_code == 403
+    assert client.get(f"/api/debug/profiles/{'0' * 32}", headers=user_headers).status_code == 403
+
+
+def test_sampler_follows_its_greenlet():
+    def request_handler():
+        sampler = StackSampler(0.005)
+        sampler.start()
+        # Suspended here while another greenlet runs
+        main.switch(sampler)
+
+    def other_request(sampler):
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            pass
+        sampler.stop()
+
+    main = greenlet.getcurrent()
+    sampler = greenlet.greenlet(request_handler).switch()
+    other_request(sampler)
+
+    assert sampler.stacks
+    assert all('request_handler' in stack for stack in sampler.stacks)
+    assert not any('other_request' in stack for stack in sampler.stacks)
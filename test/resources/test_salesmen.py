@@ -0,0 +1,84 @@
+import gzip
+import json
+
+import brotli
+from sqlalchemy import event
+
+from models import db
+from test.conftest import add_salesman
+
+
+def test_fields_limits_salesman_columns(client, admin_headers, upstream):
+    add_salesman(10, 500.0, [1, 2])
+
+    res = client.get('/api/salesman?fields=id,limit', headers=admin_headers)
+
+    assert res.status_code == 200
+    assert res.get_json() == [{'id': 1, 'limit': 500.0}]
+
+
+def test_nested_fields_load_credits_in_one_query(client, admin_headers, upstream):
+    for user_id in range(10, 15):
+        add_salesman(user_id, 500.0, [user_id * 10, user_id * 10 + 1])
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        res = client.get('/api/salesman?fields=id,salesman_credits.license_id', headers=admin_headers)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert res.status_code == 200
+    salesmen = res.get_json()
+    assert len(salesmen) == 5
+    assert salesmen[0] == {'id': 5, 'salesman_credits': [{'license_id': 140}, {'license_id': 141}]}
+    credit_queries = [statement for statement in statements if 'FROM salesman_credits' in statement]
+    assert len(credit_queries) == 1
+    assert 'salesman_credits.created' not in credit_queries[0]
+
+
+def test_unknown_field_is_rejected(client, admin_headers, upstream):
+    add_salesman(10, 500.0)
+
+    res = client.get('/api/salesman?fields=id,bogus', headers=admin_headers)
+
+    assert res.status_code == 400
+    assert upstream.logs == []
+
+
+def test_unknown_nested_field_is_rejected(client, admin_headers, upstream):
+    add_salesman(10, 500.0, [1])
+
+    res = client.get('/api/salesman?fields=salesman_credits.bogus', headers=admin_headers)
+    assert res.status_code == 400
+    res = client.get('/api/salesman?fields=limit.bogus', headers=admin_headers)
+    assert res.status_code == 400
+    assert upstream.logs == []
+
+
+def test_credit_fields(client, admin_headers, upstream):
+    add_salesman(10, 500.0, [7])
+
+    res = client.get('/api/credit?fields=license_id', headers=admin_headers)
+
+    assert res.status_code == 200
+    assert res.get_json() == [{'license_id': 7}]
+
+
+def test_large_list_is_compressed(client, admin_headers, upstream):
+    for user_id in range(10, 40):
+        add_salesman(user_id, 500.0, [user_id])
+
+    plain = client.get('/api/salesman', headers=admin_headers)
+    assert 'Content-Encoding' not in plain.headers
+    assert len(plain.data) > client.application.config['COMPRESS_MIN_SIZE']
+
+    res = client.get('/api/salesman', headers={**admin_headers, 'Accept-Encoding': 'br'})
+    assert res.status_code == 200
+    assert res.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(res.data)) == plain.get_json()
+
+    res = client.get('/api/salesman', headers={**admin_headers, 'Accept-Encoding': 'gzip'})
+    assert res.status_code == 200
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(res.data)) == plain.get_json()
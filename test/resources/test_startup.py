@@ -0,0 +1,15 @@
+import json
+import subprocess
+import sys
+
+from test.conftest import APP_DIR
+
+
+def test_cold_startup_is_within_budget():
+    # A fresh interpreter, so the import is measured cold
+    script = 'import json; from startup import measure_startup; print(json.dumps(measure_startup("testing")))'
+    output = subprocess.run([sys.executable, '-c', script], cwd=APP_DIR, capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+
+    assert timings['status_code'] == 404
+    assert timings['total'] <= timings['budget'], timings
@@ -0,0 +1,115 @@
+import fcntl
+import multiprocessing
+import os
+
+import requests
+
+from user_functions import admission_control
+from user_functions.admission_control import Bulkhead, get_token_bulkhead
+from test.conftest import add_salesman
+
+fork = multiprocessing.get_context('fork')
+
+
+def hold_slots(directory, name, limit, base, count, ready, done):
+    bulkhead = Bulkhead(name, limit, directory, base=base)
+    slots = [bulkhead.try_acquire() for _ in range(count)]
+    ready.send([slot is not None for slot in slots])
+    done.recv()
+
+
+def start_holder(directory, name, limit, count, base=0):
+    '''Hold `count` slots of a bulkhead from another process until it is stopped'''
+    ready_recv, ready_send = fork.Pipe(duplex=False)
+    done_recv, done_send = fork.Pipe(duplex=False)
+    process = fork.Process(target=hold_slots, args=(directory, name, limit, base, count, ready_send, done_recv))
+    process.start()
+    assert all(ready_recv.recv())
+    return process, done_send
+
+
+def test_limit_is_shared_across_processes(tmp_path):
+    directory = str(tmp_path)
+    process, done = start_holder(directory, 'group', 3, 2)
+
+    bulkhead = Bulkhead('group', 3, directory)
+    slot = bulkhead.try_acquire()
+    assert slot is not None
+    assert bulkhead.try_acquire() is None
+
+    done.send(True)
+    process.join()
+    assert bulkhead.try_acquire() is not None
+    bulkhead.release(slot)
+
+
+def test_killed_process_releases_its_slots(tmp_path):
+    directory = str(tmp_path)
+    process, _ = start_holder(directory, 'group', 1, 1)
+    bulkhead = Bulkhead('group', 1, directory)
+    assert bulkhead.try_acquire() is None
+
+    process.kill()
+    process.join()
+    assert bulkhead.try_acquire() is not None
+
+
+def test_rejection_skips_runs_of_held_slots(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    processes = [start_holder(directory, 'group', 600, 300) for _ in range(2)]
+    calls = []
+    real_fcntl = fcntl.fcntl
+    monkeypatch.setattr(admission_control.fcntl, 'fcntl', lambda *args: calls.append(args) or real_fcntl(*args))
+    try:
+        assert Bulkhead('group', 600, directory).try_acquire() is None
+        # Not one call per slot: each holder's slots are skipped as a run
+        assert len(calls) <= 8
+    finally:
+        for process, done in processes:
+            done.send(True)
+            process.join()
+
+
+def test_group_over_limit_gets_503_with_retry_after(app, client, admin_headers, upstream):
+    add_salesman(10, 500.0, [1])
+    app.config['ADMISSION_LIMITS'] = dict(app.config['ADMISSION_LIMITS'], credit_read=1)
+    process, done = start_holder(app.config['ADMISSION_DIR'], 'credit_read', 1, 1)
+    try:
+        res = client.get('/api/credit/1', headers=admin_headers)
+        assert res.status_code == 503
+        assert res.headers['Retry-After'] == str(app.config['ADMISSION_RETRY_AFTER'])
+        # Other groups are unaffected
+        assert client.get('/api/salesman/1', headers=admin_headers).status_code == 200
+    finally:
+        done.send(True)
+        process.join()
+
+    assert client.get('/api/credit/1', headers=admin_headers).status_code == 200
+    stats = client.get('/api/admission', headers=admin_headers).get_json()
+    assert stats['bulkheads']['credit_read']['rejected'] == 1
+    assert stats['bulkheads']['credit_read']['admitted'] == 2
+
+
+def test_token_over_quota_gets_503(app, client, admin_headers, user_headers, upstream):
+    add_salesman(10, 500.0, [1])
+    app.config['ADMISSION_TOKEN_LIMIT'] = 1
+    bucket = get_token_bulkhead(admin_headers['Authorization'])
+    process, done = start_holder(app.config['ADMISSION_DIR'], bucket.name, 1, 1, base=bucket.base)
+    try:
+        res = client.get('/api/credit/1', headers=admin_headers)
+        assert res.status_code == 503
+        assert 'Retry-After' in res.headers
+    finally:
+        done.send(True)
+        process.join()
+    assert client.get('/api/admission', headers=admin_headers).get_json()['tokens']['rejected'] == 1
+
+
+def test_upstream_timeout_is_passed_and_sheds(app, client, admin_headers, upstream):
+    upstream.error = requests.exceptions.ReadTimeout()
+
+    res = client.post('/api/salesman', json={'user_id': 5, 'limit': 100.0}, headers=admin_headers)
+
+    assert res.status_code == 503
+    assert 'Retry-After' in res.headers
+    assert upstream.calls[0][2]['timeout'] == app.config['UPSTREAM_TIMEOUT']
@@ -0,0 +1,61 @@
+import time
+
+from sqlalchemy import create_engine
+
+from models.credit import CreditModel
+from models.credit_archive import CreditArchiveModel
+from user_functions.credit_archive import archive_settled_credits
+from test.conftest import add_salesman
+
+
+def test_moves_sold_credits_batch_by_batch(upstream):
+    add_salesman(10, 1000.0, [1, 2, 3, 4, 5])
+    upstream.add_license(1, 10, 'sold')
+    upstream.add_license(2, 10, 'on_credit')
+    upstream.add_license(3, 10, 'sold')
+    upstream.add_license(5, 10, 'sold')  # license 4 is unknown to the license service
+
+    summary = archive_settled_credits({}, batch_size=2)
+
+    assert summary == {'scanned': 5, 'archived': 3, 'unresolved': 1, 'batches': 3, 'next_after_id': None}
+    assert sorted(credit.license_id for credit in CreditModel.fetch_all()) == [2, 4]
+    archived = CreditArchiveModel.fetch_all()
+    assert [credit.license_id for credit in archived] == [1, 3, 5]
+
+
+def test_stops_after_max_batches(upstream):
+    add_salesman(10, 1000.0, [1, 2, 3])
+    for license_id in (1, 2, 3):
+        upstream.add_license(license_id, 10, 'sold')
+
+    first = archive_settled_credits({}, batch_size=2, max_batches=1)
+    assert (first['archived'], first['batches']) == (2, 1)
+    assert first['next_after_id'] == CreditArchiveModel.fetch_by_license_id(2).id
+
+    rest = archive_settled_credits({}, batch_size=2, after_id=first['next_after_id'], max_batches=1)
+    assert rest['archived'] == 1
+    assert CreditModel.fetch_all() == []
+
+
+def test_credits_get_their_own_created_time(app):
+    add_salesman(10, 1000.0, [1])
+    time.sleep(0.01)
+    add_salesman(11, 1000.0, [2])
+
+    first, second = CreditModel.fetch_all()
+    assert first.created < second.created
+
+
+def test_partitioning_follows_app_config(app):
+    statements = []
+    engine = create_engine('postgresql://', strategy='mock', executor=lambda sql, *a, **kw: statements.append(str(sql.compile(dialect=engine.dialect))))
+    table = CreditArchiveModel.__table__
+
+    app.config['CREDIT_ARCHIVE_PARTITIONED'] = True
+    table.create(engine)
+    app.config['CREDIT_ARCHIVE_PARTITIONED'] = False
+    table.create(engine)
+
+    partitioned, plain = [statement for statement in statements if 'CREATE TABLE' in statement]
+    assert 'PARTITION BY RANGE (created)' in partitioned
+    assert 'PARTITION BY' not in plain
@@ -0,0 +1,148 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+from models.credit import CreditModel
+from models.idempotency import IdempotencyKeyModel
+from test.conftest import add_salesman
+
+
+def post_credit(client, headers, key, license_id=3, salesman_id=1):
+    return client.post('/api/credit', json={'salesman_id': salesman_id, 'license_id': license_id},
+                       headers={**headers, 'Idempotency-Key': key})
+
+
+def hold_key(key, locked_until):
+    '''Record the key as held by another request that is still running'''
+    body = '{"salesman_id": 1, "license_id": 3}'
+    import hashlib
+    IdempotencyKeyModel(
+        key=f'1:/api/credit:{key}',
+        request_hash=hashlib.sha256(body.encode()).hexdigest(),
+        locked_until=locked_until,
+        expires=datetime.utcnow() + timedelta(days=1),
+    ).insert_record()
+    return body
+
+
+def test_retry_replays_stored_response(client, admin_headers, upstream):
+    add_salesman(10, 100.0)
+    upstream.add_license(3, 40)
+
+    first = post_credit(client, admin_headers, 'abc')
+    calls = len(upstream.calls)
+    retry = post_credit(client, admin_headers, 'abc')
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert len(upstream.calls) == calls
+
+
+def test_key_reused_with_different_body_is_rejected(client, admin_headers, upstream):
+    add_salesman(10, 100.0)
+    upstream.add_license(3, 40)
+    upstream.add_license(4, 40)
+
+    assert post_credit(client, admin_headers, 'abc').status_code == 201
+    assert post_credit(client, admin_headers, 'abc', license_id=4).status_code == 422
+
+
+def test_duplicate_in_progress_gets_409_after_waiting(app, client, admin_headers, upstream):
+    app.config.update(IDEMPOTENCY_WAIT_TIMEOUT=0.3, IDEMPOTENCY_POLL_INTERVAL=0.05)
+    add_salesman(10, 100.0)
+    body = hold_key('abc', datetime.utcnow() + timedelta(minutes=1))
+
+    started = time.monotonic()
+    res = client.post('/api/credit', data=body, content_type='application/json',
+                      headers={**admin_headers, 'Idempotency-Key': 'abc'})
+
+    assert res.status_code == 409
+    assert 'Retry-After' in res.headers
+    assert time.monotonic() - started >= 0.3
+    assert upstream.calls == []
+
+
+def test_duplicate_waits_for_first_request_to_finish(app, client, admin_headers, upstream):
+    app.config.update(IDEMPOTENCY_WAIT_TIMEOUT=5, IDEMPOTENCY_POLL_INTERVAL=0.05)
+    body = hold_key('abc', datetime.utcnow() + timedelta(minutes=1))
+
+    def finish():
+        time.sleep(0.2)
+        with app.app_context():
+            IdempotencyKeyModel.complete('1:/api/credit:abc', 201, '{"id": 7}')
+    thread = threading.Thread(target=finish)
+    thread.start()
+    res = client.post('/api/credit', data=body, content_type='application/json',
+                      headers={**admin_headers, 'Idempotency-Key': 'abc'})
+    thread.join()
+
+    assert res.status_code == 201
+    assert res.get_json() == {'id': 7}
+    assert upstream.calls == []
+
+
+def test_stale_lease_is_taken_over(client, admin_headers, upstream):
+    add_salesman(10, 100.0)
+    upstream.add_license(3, 40)
+    body = hold_key('abc', datetime.utcnow() - timedelta(seconds=1))
+
+    res = client.post('/api/credit', data=body, content_type='application/json',
+                      headers={**admin_headers, 'Idempotency-Key': 'abc'})
+
+    assert res.status_code == 201
+    assert IdempotencyKeyModel.fetch_by_key('1:/api/credit:abc').status == 'completed'
+
+
+def test_server_error_after_write_is_stored(client, admin_headers, upstream):
+    add_salesman(10, 100.0)
+    upstream.add_license(3, 40)
+    upstream.credit_put_status = 502
+
+    first = post_credit(client, admin_headers, 'abc')
+    assert first.status_code == 502
+    assert CreditModel.fetch_by_license_id(3) is not None
+
+    upstream.credit_put_status = 200
+    retry = post_credit(client, admin_headers, 'abc')
+    assert retry.status_code == 502
+    assert retry.get_json() == first.get_json()
+
+
+def test_server_error_before_write_releases_key(client, admin_headers, upstream):
+    add_salesman(10, 100.0)
+    upstream.add_license(3, 40)
+    upstream.error = requests.exceptions.ConnectTimeout()
+
+    assert post_credit(client, admin_headers, 'abc').status_code == 503
+    assert CreditModel.fetch_all() == []
+
+    upstream.error = None
+    assert post_credit(client, admin_headers, 'abc').status_code == 201
+
+
+def test_lease_is_renewed_while_the_request_runs(app, client, admin_headers, upstream, monkeypatch):
+    app.config.update(IDEMPOTENCY_LEASE=0.3, IDEMPOTENCY_WAIT_TIMEOUT=5, IDEMPOTENCY_POLL_INTERVAL=0.05)
+    add_salesman(10, 100.0)
+    upstream.add_license(3, 40)
+
+    def slow_upstream(method, url, **kwargs):
+        if method.upper() == 'PUT':
+            time.sleep(1)
+        return upstream(method, url, **kwargs)
+    monkeypatch.setattr(requests.api, 'request', slow_upstream)
+
+    responses = {}
+    first = threading.Thread(target=lambda: responses.update(first=post_credit(app.test_client(), admin_headers, 'abc')))
+    first.start()
+    # Well past the lease, while the first request is still in its license PUT
+    time.sleep(0.6)
+    duplicate = post_credit(client, admin_headers, 'abc')
+    first.join()
+
+    assert responses['first'].status_code == 201
+    assert duplicate.status_code == 201
+    assert duplicate.headers['Idempotent-Replayed'] == 'true'
+    assert len([call for call in upstream.calls if call[0] == 'PUT']) == 1